@@ -0,0 +1,25 @@
+'''Entry point for `python -m scripts <command>`'''
+
+import os
+import sys
+
+# The scripts import each other as top level modules, the same way as when run directly
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import main as benchmark_main
+from build import main as build_main
+from synthetic import main as synthetic_main
+from validate import main as validate_main
+
+COMMANDS = {
+    "build": build_main,
+    "benchmark": benchmark_main,
+    "synthetic": synthetic_main,
+    "validate": validate_main,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Usage: python -m scripts <command> [options]. Commands: {', '.join(COMMANDS)}")
+        sys.exit(1)
+    COMMANDS[sys.argv[1]](sys.argv[2:])
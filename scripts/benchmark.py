@@ -0,0 +1,138 @@
+'''Time and memory use of each processor on synthetic sheets, compared with a stored baseline'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from build import STAGES
+from refindex import VerseIndex
+from schema import apply_schema
+from synthetic import make_frame
+from tokens import token_table
+
+BASELINE_FILE = "benchmarks/baseline.json"
+DEFAULT_SCALES = [0.1, 1.0]
+
+def run_stage(stage, bsb_df, verse_index, tokens, output_folder):
+    stage_folder = os.path.join(output_folder, stage.output_subfolder)
+    os.makedirs(stage_folder, exist_ok=True)
+    kwargs = {"verse_index": verse_index} if stage.uses_verse_index else {}
+    if stage.uses_tokens:
+        kwargs["tokens"] = tokens
+    # The processors print a line per book, which would bury the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage.processor(None, None, None, stage_folder, bsb_df=bsb_df, **kwargs)
+
+def measure(run, repeat=1, memory=True):
+    '''Best time of repeat runs, and the peak of memory allocated by Python during one more run'''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    result = {"seconds": round(min(seconds), 3)}
+    if memory:
+        # tracemalloc slows down the run a lot, so it is measured separately from the time
+        tracemalloc.start()
+        run()
+        result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result
+
+def benchmark(scales=DEFAULT_SCALES, stages=None, repeat=1, memory=True):
+    '''Results by scale, then by stage. The verse index and the token table are shared by the stages,
+    as in a build, and measured on their own'''
+    stages = stages or list(STAGES)
+    results = {}
+    for scale in scales:
+        bsb_df = apply_schema(make_frame(scale))
+        print(f"Scale {scale}: {len(bsb_df)} rows")
+        scale_results = {"rows": len(bsb_df)}
+        scale_results["verse_index"] = measure(lambda: VerseIndex.from_frame(bsb_df), repeat, memory)
+        verse_index = VerseIndex.from_frame(bsb_df)
+        tokens = None
+        if any(STAGES[name].uses_tokens for name in stages):
+            scale_results["token_table"] = measure(lambda: token_table(bsb_df, verse_index), repeat, memory)
+            tokens = token_table(bsb_df, verse_index)
+        with tempfile.TemporaryDirectory() as output_folder:
+            for name in stages:
+                scale_results[name] = measure(
+                    lambda: run_stage(STAGES[name], bsb_df, verse_index, tokens, output_folder), repeat, memory)
+                print(f"  {name}: {scale_results[name]}")
+        results[str(scale)] = scale_results
+    return results
+
+def compare(results, baseline, tolerance):
+    '''Print the results next to the baseline. Returns the names of the measures that got
+    worse than the baseline by more than the tolerance, eg: 0.25 for 25%'''
+    regressions = []
+    print(f"{'scale':>6} {'stage':<12} {'seconds':>9} {'baseline':>9} {'peak MB':>9} {'baseline':>9}")
+    for scale, scale_results in results.items():
+        base_results = baseline.get(scale, {})
+        for name, result in scale_results.items():
+            if name == "rows":
+                continue
+            base = base_results.get(name, {})
+            cells = []
+            for measure_name in ("seconds", "peak_mb"):
+                value, base_value = result.get(measure_name), base.get(measure_name)
+                cells.append("" if value is None else f"{value:9}")
+                cells.append("" if base_value is None else f"{base_value:9}")
+                if value is not None and base_value and value > base_value * (1 + tolerance):
+                    regressions.append(f"{name} {measure_name} at scale {scale}")
+            print(f"{scale:>6} {name:<12} " + " ".join(f"{cell:>9}" for cell in cells))
+    for regression in regressions:
+        print(f"Slower or larger than the baseline: {regression}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the processors on synthetic sheets")
+    parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES),
+                        help="Comma separated sizes relative to the real sheet")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma separated stages to measure, from: {', '.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage, the best time is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the slower memory measurement")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store the results as the new baseline, instead of comparing with it")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown or growth relative to the baseline, eg: 0.25 for 25%%")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 if any measure is worse than the baseline")
+    args = parser.parse_args(argv)
+    scales = [float(scale) for scale in args.scales.split(",")]
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    results = benchmark(scales, stages, args.repeat, not args.no_memory)
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"Saved the baseline to {args.baseline}")
+        return
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    else:
+        print(f"No baseline at {args.baseline}. Use --save-baseline to store one")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+'''Build driver that reads the input XLSX file once and runs the selected processors on it'''
+
+import argparse
+import os
+from collections import namedtuple
+
+import chunked
+import incremental
+import profiling
+from loader import input_formats, load_bsb_sheet, iter_bsb_rows
+from parallel import process_book_lines_in_parallel, process_books_in_parallel
+from refindex import VerseIndex, book_codes
+from schema import columns_for, index_columns
+from scope import RowIndex, parse_range
+import processBSBEnglish
+import processWLCHebrew
+import processNestleGreek
+import processAlignment
+import processDictionary
+import processConcordance
+import processTokens
+import concordance
+import strongs
+import tokens
+
+Stage = namedtuple("Stage",
+                   ["processor", "output_subfolder", "columns", "requires", "uses_verse_index",
+                    "book_file", "book_lines", "output_files", "uses_tokens", "part_writer"],
+                   defaults=[(), True, None, False, (), False, None])
+
+# Each stage builds one set of outputs, from the given columns of the sheet.
+# `requires` lists the stages that have to run before it, so that selecting a stage also
+# pulls in what it depends on. Stages with a book_file write one file per book, and can process
+# the books in parallel. Stages with book_lines write parallel files with the lines of the books
+# one after the other. Stages using tokens render from the token table of tokens.py, which is
+# built once in memory for all of them, so they do not require the tokens stage writing it out. When the sheet is processed in chunks, the stages without a book_file
+# hand the results of each chunk, its token table or its lines, to their part_writer as it is made.
+STAGES = {
+    "tokens": Stage(processTokens.ProcessTokens, "", tokens.sheet_columns,
+                    output_files=tokens.output_files, uses_tokens=True, part_writer=tokens.TokenWriter),
+    "bsb": Stage(processBSBEnglish.ProcessBSBEnglish, "bsb_usfms", processBSBEnglish.sheet_columns,
+                 book_file="bsb_{}.usfm"),
+    "hebrew": Stage(processWLCHebrew.ProcessWLCHebrew, "heb_usfms", processWLCHebrew.sheet_columns,
+                    book_file="heb_{}.usfm", uses_tokens=True),
+    "greek": Stage(processNestleGreek.ProcessNestleGreek, "grk_usfms", processNestleGreek.sheet_columns,
+                   book_file="grk_{}.usfm", uses_tokens=True),
+    "alignment": Stage(processAlignment.ProcessAlignment, "", processAlignment.sheet_columns,
+                       book_lines=True, output_files=processAlignment.output_files,
+                       part_writer=processAlignment.OutputLinesWriter),
+    "dictionary": Stage(processDictionary.ProcessDictionary, "", processDictionary.sheet_columns,
+                        output_files=[processDictionary.output_file, strongs.store_file],
+                        uses_tokens=True, part_writer=processDictionary.DictionaryWriter),
+    "concordance": Stage(processConcordance.ProcessConcordance, "", processConcordance.sheet_columns,
+                         output_files=concordance.output_files, uses_tokens=True,
+                         part_writer=processConcordance.ConcordanceWriter),
+}
+
+# Folder of the outputs of the whole sheet
+DEFAULT_OUTPUT = "output"
+
+def resolve_stages(selected):
+    '''Order the selected stages and their requirements so that every stage runs after its requirements'''
+    ordered = []
+    def visit(name, path):
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage {name!r}. Available stages: {', '.join(STAGES)}")
+        if name in path:
+            raise ValueError(f"Cyclic stage requirement: {' -> '.join(path + (name,))}")
+        if name in ordered:
+            return
+        for req in STAGES[name].requires:
+            visit(req, path + (name,))
+        ordered.append(name)
+    for name in selected:
+        visit(name, ())
+    return ordered
+
+def stage_output_folder(output_folder, stage):
+    return f"{output_folder}/{stage.output_subfolder}" if stage.output_subfolder else output_folder
+
+def build(filepath, excel_sheet, header_row, output_folder=DEFAULT_OUTPUT, stages=None,
+          use_cache=True, refresh_cache=False, streaming=False, jobs=1, incremental_build=False,
+          profile_report=None, books=None, ranges=None, input_format=None, max_memory=None):
+    '''Load the sheet once and hand the same frame to the processors of the selected stages.
+    With streaming=True the sheet is not loaded, and each processor streams the rows it needs instead.
+    With jobs > 1 the books of the USFM and alignment stages are processed in that many worker processes.
+    With incremental_build=True only the outputs of books changed since the last build are regenerated.
+    With a profile_report path, or the BEREAN_PROFILE environment variable set, the time and memory
+    of each phase are printed and saved to a JSON report.
+    books, a list of book codes, and ranges, a list of references like "ROM 8:1-39", limit the build
+    to those verses. The outputs then have only those verses, the same as in a build of the whole sheet,
+    so they have to go to another output_folder than the default one of the whole sheet.
+    The input can be an XLSX file, or a CSV, TSV or Parquet export of the sheet. Its format is taken
+    from the file extension, unless given as input_format.
+    With max_memory, in megabytes, the rows are streamed and processed in chunks of whole books that
+    take about that much memory, so the peak memory is bounded by the largest book instead of the sheet'''
+    stages = resolve_stages(stages or list(STAGES))
+    books = [book.strip().upper() for book in books or [] if book.strip()]
+    unknown = [book for book in books if book not in book_codes]
+    if unknown:
+        raise ValueError(f"Unknown book codes: {', '.join(unknown)}")
+    ranges = [parse_range(text) for text in ranges or []]
+    if (books or ranges) and os.path.normpath(output_folder) == os.path.normpath(DEFAULT_OUTPUT):
+        raise ValueError(f"The outputs of only some books or ranges would replace those of the whole sheet "
+                         f"in {DEFAULT_OUTPUT}, give another output folder for them")
+    if (books or ranges) and (streaming or incremental_build):
+        raise ValueError("Building only some books or ranges needs the whole sheet loaded, "
+                         "it cannot be streamed or combined with incremental builds")
+    if streaming and jobs > 1:
+        raise ValueError("Processing books in parallel needs the whole sheet loaded, it cannot be streamed")
+    if streaming and incremental_build:
+        raise ValueError("Incremental builds need the whole sheet loaded, it cannot be streamed")
+    if max_memory is not None and (streaming or jobs > 1 or incremental_build or books or ranges):
+        raise ValueError("Processing the sheet in chunks cannot be combined with streaming, parallel jobs, "
+                         "incremental builds or building only some books or ranges")
+    if max_memory is not None and max_memory <= 0:
+        raise ValueError("The memory limit has to be a positive number of megabytes")
+    if profile_report or profiling.enabled_by_env():
+        profiling.start(profile_report)
+    try:
+        if max_memory is not None:
+            columns = columns_for(index_columns, *[STAGES[name].columns for name in stages])
+            chunked.build_chunked(filepath, excel_sheet, header_row,
+                                  [(name, STAGES[name], stage_output_folder(output_folder, STAGES[name])) for name in stages],
+                                  columns, max_memory, input_format)
+        else:
+            run_stages(filepath, excel_sheet, header_row, output_folder, stages,
+                       use_cache, refresh_cache, streaming, jobs, incremental_build, books, ranges, input_format)
+    finally:
+        profiling.finish()
+
+def run_stages(filepath, excel_sheet, header_row, output_folder, stages,
+               use_cache, refresh_cache, streaming, jobs, incremental_build, books=(), ranges=(),
+               input_format=None):
+    '''Load the sheet and run the stages, each as a profiling phase'''
+    bsb_df = None
+    token_table = None
+    if streaming:
+        with profiling.phase("verse_index") as record:
+            verse_index = VerseIndex.from_rows(
+                iter_bsb_rows(filepath, excel_sheet, header_row, index_columns, input_format))
+            record["rows"] = len(verse_index.row_verse)
+    else:
+        with profiling.phase("load") as record:
+            columns = columns_for(index_columns, *[STAGES[name].columns for name in stages])
+            bsb_df = load_bsb_sheet(filepath, excel_sheet, header_row, use_cache, refresh_cache, columns,
+                                    input_format)
+            record["rows"] = len(bsb_df)
+        with profiling.phase("verse_index", len(bsb_df)):
+            verse_index = VerseIndex.from_frame(bsb_df)
+        if books or ranges:
+            # The verse starts stay as computed over the whole sheet
+            rows = RowIndex(verse_index).rows(books, ranges)
+            if len(rows) == 0:
+                raise ValueError("No verses of the sheet are in the given books or ranges")
+            bsb_df = bsb_df.iloc[rows]
+            verse_index = verse_index.subset(rows)
+        if any(STAGES[name].uses_tokens for name in stages):
+            with profiling.phase("token_table", len(bsb_df)):
+                token_table = tokens.token_table(bsb_df, verse_index)
+    row_count = len(verse_index.row_verse)
+    if incremental_build:
+        manifest = incremental.load_manifest(output_folder)
+    for name in stages:
+        stage = STAGES[name]
+        stage_folder = stage_output_folder(output_folder, stage)
+        kwargs = {"verse_index": verse_index} if stage.uses_verse_index else {}
+        if stage.uses_tokens and token_table is not None:
+            kwargs["tokens"] = token_table
+        print(f"Building {name}")
+        with profiling.phase(name, row_count):
+            if incremental_build:
+                manifest[name] = incremental.build_stage(stage, filepath, excel_sheet, header_row, stage_folder,
+                                                         bsb_df, verse_index, manifest.get(name, {}), jobs)
+                incremental.save_manifest(output_folder, manifest)
+            elif jobs > 1 and stage.book_file:
+                process_books_in_parallel(stage.processor, filepath, excel_sheet, header_row, stage_folder,
+                                          bsb_df, verse_index, jobs)
+            elif jobs > 1 and stage.book_lines:
+                process_book_lines_in_parallel(stage.processor, filepath, excel_sheet, header_row, stage_folder,
+                                               bsb_df, verse_index, jobs)
+            else:
+                stage.processor(filepath, excel_sheet, header_row, stage_folder,
+                                bsb_df=bsb_df, streaming=streaming, input_format=input_format, **kwargs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the Berean outputs from the input XLSX file")
+    parser.add_argument("--input", default="input/bsb_tables.xlsx",
+                        help="The XLSX file, or a CSV, TSV or Parquet export of its sheet")
+    parser.add_argument("--input-format", choices=sorted(set(input_formats.values())),
+                        help="Format of the input file, if its extension does not tell it")
+    parser.add_argument("--sheet", default="biblosinterlinear96")
+    parser.add_argument("--header-row", type=int, default=1)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="Folder of the outputs. Builds of --books or --range need another folder than "
+                             f"the default {DEFAULT_OUTPUT}")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma separated stages to build, from: {', '.join(STAGES)}")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always parse the XLSX file, without using or updating the sheet cache")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Parse the XLSX file again and replace its cached copy")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the rows from the XLSX file instead of loading the whole sheet. "
+                             "Keeps the memory use low, but parses the file once per pass of each stage")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes to generate the USFM files and the alignment "
+                             "of the books in")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Regenerate only the outputs of books whose rows changed since the last "
+                             f"incremental build, as recorded in {incremental.MANIFEST_FILE} in the output folder")
+    parser.add_argument("--profile", nargs="?", const=profiling.DEFAULT_REPORT, metavar="REPORT",
+                        help="Print the time, rows per second and growth of the peak memory of each phase, and save them "
+                             f"with per-book times to a JSON report (default {profiling.DEFAULT_REPORT}). "
+                             f"Setting {profiling.ENV_VAR} to a report path does the same")
+    parser.add_argument("--books", default="",
+                        help="Comma separated book codes to build the outputs of, eg: ROM,JHN")
+    parser.add_argument("--range", action="append", default=[], dest="ranges",
+                        help="Verses to build the outputs of, eg: 'ROM 8:1-39', 'ROM 8' or 'ROM 8:1-9:5'. "
+                             "Can be given more than once, and together with --books")
+    parser.add_argument("--max-memory", type=float, metavar="MB",
+                        help="Stream the rows and process them in chunks of whole books of about this many "
+                             "megabytes, so that the peak memory is bounded by the largest book. "
+                             "The outputs are the same as those of a build loading the whole sheet")
+    args = parser.parse_args(argv)
+    stages = [name.strip() for name in args.stages.split(",") if name.strip()]
+    build(args.input, args.sheet, args.header_row, args.output, stages,
+          use_cache=not args.no_cache, refresh_cache=args.refresh_cache, streaming=args.stream,
+          jobs=args.jobs, incremental_build=args.incremental,
+          profile_report=args.profile, books=args.books.split(","), ranges=args.ranges,
+          input_format=args.input_format, max_memory=args.max_memory)
+
+if __name__ == "__main__":
+    main()
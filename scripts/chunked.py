@@ -0,0 +1,99 @@
+'''Memory bounded builds: the rows of the sheet are streamed in chunks of whole books, and only one
+chunk is held in memory at a time. The only state of the processors crossing a book boundary, the
+. . . and vvv cells left pending by the alignment, is carried from a chunk to the next, and the
+outputs of the whole sheet are written or collected a chunk at a time, so they are the same as
+those of a build loading the whole sheet'''
+
+import itertools
+
+import pandas as pd
+
+import profiling
+from loader import iter_bsb_rows, rows_frame
+from parallel import book_row_ranges, books_are_contiguous
+from refindex import VerseIndex
+from schema import apply_schema
+from tokens import token_table
+
+# The processors work on copies of the rows of a chunk, like the token table and the rendered
+# texts, so a chunk takes about this many times the memory of its frame
+COPY_FACTOR = 4
+
+def iter_chunks(rows, book_ranges, columns, max_bytes):
+    '''Frames of the streamed rows, each of whole books taking at most about max_bytes with their copies,
+    with the positional slice of their rows in the sheet. A book larger than that is a chunk of its own'''
+    frames = []
+    chunk_bytes = 0
+    chunk_start = 0
+    for _, book_rows in book_ranges:
+        book_df = apply_schema(rows_frame(list(itertools.islice(rows, book_rows.stop - book_rows.start)), columns))
+        book_bytes = int(book_df.memory_usage(deep=True).sum()) * COPY_FACTOR
+        if frames and chunk_bytes + book_bytes > max_bytes:
+            # The frames of the books are released before the chunk is processed
+            chunk_df, frames = pd.concat(frames), []
+            yield chunk_df, slice(chunk_start, book_rows.start)
+            del chunk_df
+            chunk_bytes, chunk_start = 0, book_rows.start
+        frames.append(book_df)
+        chunk_bytes += book_bytes
+    if frames:
+        chunk_df, frames = pd.concat(frames), []
+        yield chunk_df, slice(chunk_start, book_ranges[-1][1].stop)
+
+def build_chunked(filepath, excel_sheet, header_row, stages, columns, max_memory_mb, input_format=None):
+    '''Run the stages, a list of (name, Stage, output folder) in the order to run them, on chunks of the sheet
+    of at most about max_memory_mb megabytes.
+
+    Stages with a book_file write the files of the books of each chunk. The other stages hand the
+    results of each chunk, the lines of its books or its token table, to their part_writer, which
+    writes them out or keeps them as compact arrays, and saves the outputs of the whole sheet at the end.
+    So no rows, lines or token tables of the earlier chunks are kept while the next one is read'''
+    unchunked = [name for name, stage, _ in stages if not stage.book_file and stage.part_writer is None]
+    if unchunked:
+        raise ValueError(f"The stages {', '.join(unchunked)} cannot be processed in chunks")
+    # A first pass indexes the verses, so that the chunks know where the verses and books start
+    with profiling.phase("verse_index") as record:
+        verse_index = VerseIndex.from_rows(iter_bsb_rows(filepath, excel_sheet, header_row, columns, input_format))
+        record["rows"] = row_count = len(verse_index.row_verse)
+    book_ranges = book_row_ranges(verse_index)
+    if not book_ranges:
+        raise ValueError(f"No rows found in {filepath}")
+    max_bytes = max_memory_mb * 2**20
+    if not books_are_contiguous(book_ranges):
+        # The later rows of a book would overwrite its files, so it has to be in one chunk
+        print("Books are not contiguous in the sheet. Processing it as one chunk")
+        max_bytes = float("inf")
+
+    uses_tokens = any(stage.uses_tokens for _, stage, _ in stages)
+    writers = [None if stage.book_file else stage.part_writer(stage_folder) for _, stage, stage_folder in stages]
+    # The alignment state left pending by the last chunk, for each stage writing book lines
+    pendings = {}
+    rows = iter_bsb_rows(filepath, excel_sheet, header_row, columns, input_format)
+    with profiling.phase("chunks", row_count):
+        for chunk_df, chunk_rows in iter_chunks(rows, book_ranges, columns, max_bytes):
+            chunk_index = verse_index.subset(chunk_rows)
+            # Built with the index of the whole sheet, for the verse_ordinal of a whole build
+            chunk_tokens = token_table(chunk_df, verse_index) if uses_tokens else None
+            for (name, stage, stage_folder), writer in zip(stages, writers):
+                if stage.book_file and stage.uses_tokens:
+                    stage.processor(filepath, excel_sheet, header_row, stage_folder,
+                                    verse_index=verse_index, tokens=chunk_tokens)
+                elif stage.book_file:
+                    stage.processor(filepath, excel_sheet, header_row, stage_folder,
+                                    bsb_df=chunk_df, verse_index=chunk_index)
+                elif stage.book_lines:
+                    aligner = stage.processor(filepath, excel_sheet, header_row, None, bsb_df=chunk_df,
+                                              verse_index=chunk_index, pending=pendings.get(name))
+                    writer.write(aligner.align_table.output_lines())
+                    pendings[name] = aligner.pending()
+                    del aligner
+                else:
+                    writer.write(chunk_tokens)
+            # Released before the next chunk is read
+            del chunk_df, chunk_tokens
+            print(f"Processed rows {chunk_rows.start} to {chunk_rows.stop} of {row_count}")
+
+    for (name, stage, _), writer in zip(stages, writers):
+        if writer is not None:
+            with profiling.phase(name, row_count):
+                writer.close()
@@ -0,0 +1,135 @@
+'''Concordance of the Strongs numbers, as NumPy arrays that can be memory mapped: where each
+number occurs in the source texts, and the English phrase it is rendered with there'''
+
+import io
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from corpus import offsets
+from refindex import book_codes
+from strongs import StrongsDictionary
+
+concordance_folder = "strongs_concordance"
+# Occurrences of each number, in the source word order. Arrays of one value per occurrence
+occurrence_arrays = ["book_id", "chapter", "verse", "word", "phrase_id"]
+occurrence_dtypes = {"book_id": np.int8, "chapter": np.int16, "verse": np.int16, "word": np.int32,
+                     "phrase_id": np.int32}
+array_names = ["keys", "offsets", *occurrence_arrays, "phrase_offsets", "phrase_bytes"]
+output_files = [f"{concordance_folder}/{name}.npy" for name in array_names]
+
+Occurrence = namedtuple("Occurrence", ["vref", "word", "phrase"])
+
+def strong_key(initial, number):
+    '''Integer key of a Strongs number, like G3972, from its initial and number'''
+    return (ord(initial) << 24) | number
+
+def parse_strong(strong):
+    '''Initial and number of a Strongs number, as in the dictionary keys (G3972) or in the USFM files (g3972)'''
+    strong = StrongsDictionary.normalize(strong)
+    if len(strong) < 2 or not strong[0].isalpha() or not strong[1:].isdigit():
+        raise KeyError(strong)
+    return strong[0], int(strong[1:])
+
+def save_concordance(output_folder, keys, occurrences, phrases, sink):
+    '''Write the concordance through the OutputSink. keys has the Strongs key of each occurrence, and
+    occurrences the arrays of occurrence_arrays, where phrase_id is a position in the list of phrases.
+    The occurrences are grouped by key, with the offsets of each key as in a CSR matrix.
+    Returns the number of keys'''
+    folder = os.path.join(output_folder, concordance_folder)
+    os.makedirs(folder, exist_ok=True)
+    order = np.argsort(keys, kind='stable')
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    phrase_bytes = [phrase.encode('utf-8') for phrase in phrases]
+    arrays = {"keys": unique_keys.astype(np.int64), "offsets": offsets(counts)}
+    for name in occurrence_arrays:
+        arrays[name] = occurrences[name][order]
+    arrays["phrase_offsets"] = offsets([len(phrase) for phrase in phrase_bytes])
+    arrays["phrase_bytes"] = np.frombuffer(b"".join(phrase_bytes), dtype=np.uint8)
+    for name in array_names:
+        content = io.BytesIO()
+        np.save(content, arrays[name])
+        sink.write(os.path.join(folder, f"{name}.npy"), content.getvalue())
+    return len(unique_keys)
+
+class ConcordanceBuilder:
+    '''Collects the occurrences of consecutive parts of the sheet, like its books, as compact arrays
+    with one list of the phrases of all of them, and saves the concordance of the whole at the end'''
+
+    def __init__(self):
+        self.keys = []
+        self.occurrences = {name: [] for name in occurrence_arrays}
+        self.phrase_ids = {}
+
+    def add(self, keys, occurrences, phrases):
+        '''The occurrences of the next part, as save_concordance() takes them'''
+        phrase_ids = np.array([self.phrase_ids.setdefault(phrase, len(self.phrase_ids)) for phrase in phrases],
+                              dtype=occurrence_dtypes["phrase_id"])
+        self.keys.append(keys)
+        for name in occurrence_arrays:
+            values = occurrences[name]
+            self.occurrences[name].append(phrase_ids[values] if name == "phrase_id" else values)
+
+    def save(self, output_folder, sink):
+        '''Write the concordance of all the parts through the OutputSink. Returns the number of keys'''
+        keys = np.concatenate([np.zeros(0, dtype=np.int64), *self.keys])
+        occurrences = {name: np.concatenate([np.zeros(0, dtype=occurrence_dtypes[name]), *parts])
+                       for name, parts in self.occurrences.items()}
+        return save_concordance(output_folder, keys, occurrences, list(self.phrase_ids), sink)
+
+class Concordance:
+    '''Reader of a concordance written by save_concordance(). The arrays are memory mapped, and a lookup
+    is a binary search in the keys followed by slices of the occurrence arrays'''
+
+    def __init__(self, output_folder="output"):
+        folder = os.path.join(output_folder, concordance_folder)
+        if not os.path.isdir(folder):
+            raise FileNotFoundError(folder)
+        for name in array_names:
+            setattr(self, name, np.load(os.path.join(folder, f"{name}.npy"), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def span(self, strong):
+        '''Positions of the occurrences of the number in the occurrence arrays, as a slice.
+        Raises KeyError if the number does not occur'''
+        key = strong_key(*parse_strong(strong))
+        position = int(np.searchsorted(self.keys, key))
+        if position == len(self.keys) or self.keys[position] != key:
+            raise KeyError(strong)
+        return slice(int(self.offsets[position]), int(self.offsets[position + 1]))
+
+    def __contains__(self, strong):
+        try:
+            self.span(strong)
+        except KeyError:
+            return False
+        return True
+
+    def count(self, strong):
+        found = self.span(strong)
+        return found.stop - found.start
+
+    def arrays(self, strong):
+        '''The occurrence arrays of the number, by name, as read only views'''
+        found = self.span(strong)
+        return {name: getattr(self, name)[found] for name in occurrence_arrays}
+
+    def phrase(self, phrase_id):
+        return bytes(self.phrase_bytes[self.phrase_offsets[phrase_id]:self.phrase_offsets[phrase_id + 1]]) \
+            .decode('utf-8')
+
+    def occurrences(self, strong):
+        '''Occurrence of the number in each verse, with the word number in the source text of the verse,
+        counting from 1 as in the srcloc of the USFM files, and its English phrase'''
+        found = self.arrays(strong)
+        return [Occurrence(f"{book_codes[book_id]} {chapter}:{verse}", int(word), self.phrase(phrase_id))
+                for book_id, chapter, verse, word, phrase_id in zip(*(found[name] for name in occurrence_arrays))]
+
+    def renderings(self, strong):
+        '''The English phrases the number is rendered with, and how often, the most frequent first'''
+        phrase_ids, counts = np.unique(self.arrays(strong)["phrase_id"], return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        return {self.phrase(int(phrase_ids[index])): int(counts[index]) for index in order}
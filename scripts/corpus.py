@@ -0,0 +1,173 @@
+'''Binary bundle of the alignment outputs, as NumPy arrays that can be memory mapped,
+so that the text and alignment of a verse can be looked up without parsing the text files'''
+
+import io
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from refindex import book_codes
+
+bundle_folder = "corpus_bundle"
+
+Verse = namedtuple("Verse", ["vref", "source", "target", "alignment"])
+
+book_ids = {code: book_id for book_id, code in enumerate(book_codes)}
+EMPTY_SLOT = -1
+
+def vref_key(vref):
+    '''Integer key of a reference like GEN 1:1'''
+    book_code, chapter_verse = vref.split(" ")
+    chapter, verse = chapter_verse.split(":")
+    return (book_ids[book_code] << 20) | (int(chapter) << 10) | int(verse)
+
+def key_vref(key):
+    return f"{book_codes[key >> 20]} {(key >> 10) & 0x3ff}:{key & 0x3ff}"
+
+def slot_of(key, mask):
+    return (key * 2654435761) & mask
+
+def hash_table(keys):
+    '''Open addressing table of rows, with linear probing, at most half full'''
+    size = 1 << max(int(2 * len(keys)).bit_length(), 1)
+    slots = np.full(size, EMPTY_SLOT, dtype=np.int32)
+    for row, key in enumerate(keys.tolist()):
+        slot = slot_of(key, size - 1)
+        while slots[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (size - 1)
+        slots[slot] = row
+    return slots
+
+def offsets(counts):
+    return np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+
+def save_bundle(data_folder, lines, sink):
+    '''Write the bundle for the output lines of the alignment, as given by AlignmentTable.output_lines(),
+    through the OutputSink'''
+    builder = BundleBuilder()
+    builder.add(lines)
+    builder.save(data_folder, sink)
+
+class BundleBuilder:
+    '''Collects the arrays of the bundle for the output lines of consecutive parts of the sheet, like its
+    books, and saves the bundle of all of them at the end. Only the arrays are kept, not the lines'''
+
+    def __init__(self):
+        self.line_lengths = [[] for _ in range(4)]
+        # The words of each side get their own vocabulary, joined in save() into the one of the bundle
+        self.vocabs = {"source": {}, "target": {}}
+        self.word_counts = {"source": [], "target": []}
+        self.token_ids = {"source": [], "target": []}
+        self.pairs = []
+        self.pair_counts = []
+        self.vref_keys = []
+
+    def add(self, lines):
+        '''The output lines of the next part, as given by AlignmentTable.output_lines()'''
+        source, target, alignment, vrefs = lines.values()
+        for lengths, file_lines in zip(self.line_lengths, lines.values()):
+            lengths.extend(len(line.encode('utf-8')) + 1 for line in file_lines)
+        for side, side_lines in (("source", source), ("target", target)):
+            vocab = self.vocabs[side]
+            tokens = [line.split(" ") if line else [] for line in side_lines]
+            self.word_counts[side].extend(len(words) for words in tokens)
+            self.token_ids[side].append(np.array(
+                [vocab.setdefault(word, len(vocab)) for words in tokens for word in words], dtype=np.int32))
+        self.pairs.append(np.array(" ".join(alignment).replace("-", " ").split(), dtype=np.int32))
+        self.pair_counts.extend(line.count("-") for line in alignment)
+        self.vref_keys.extend(vref_key(vref) for vref in vrefs)
+
+    def save(self, data_folder, sink):
+        '''Write the bundle of all the parts through the OutputSink'''
+        folder = os.path.join(data_folder, bundle_folder)
+        os.makedirs(folder, exist_ok=True)
+
+        # Byte offsets of the lines in each text file, for readers seeking into them directly
+        line_offsets = np.stack([offsets(lengths) for lengths in self.line_lengths])
+        line_offsets[:, -1] -= 1  # No newline after the last line
+
+        # One vocabulary for the words of both sides, the source words first
+        vocab = dict(self.vocabs["source"])
+        arrays = {"line_offsets": line_offsets}
+        for side in ("source", "target"):
+            vocab_ids = np.array([vocab.setdefault(word, len(vocab)) for word in self.vocabs[side]], dtype=np.int32)
+            arrays[f"{side}_offsets"] = offsets(self.word_counts[side])
+            arrays[f"{side}_tokens"] = vocab_ids[np.concatenate([np.zeros(0, dtype=np.int32), *self.token_ids[side]])]
+        vocab_bytes = [word.encode('utf-8') for word in vocab]
+        arrays["vocab_offsets"] = offsets([len(word) for word in vocab_bytes])
+        arrays["vocab_bytes"] = np.frombuffer(b"".join(vocab_bytes), dtype=np.uint8)
+
+        # Pharaoh pairs as (source, target) rows, int16 unless some index is too large for it
+        pairs = np.concatenate([np.zeros(0, dtype=np.int32), *self.pairs]).reshape(-1, 2)
+        if len(pairs) == 0 or pairs.max() <= np.iinfo(np.int16).max:
+            pairs = pairs.astype(np.int16)
+        arrays["pairs"] = pairs
+        arrays["pair_offsets"] = offsets(self.pair_counts)
+
+        arrays["vref_keys"] = np.array(self.vref_keys, dtype=np.int32)
+        arrays["vref_slots"] = hash_table(arrays["vref_keys"])
+        for name, values in arrays.items():
+            content = io.BytesIO()
+            np.save(content, values)
+            sink.write(os.path.join(folder, f"{name}.npy"), content.getvalue())
+
+class CorpusBundle:
+    '''Reader of a bundle written by save_bundle(). The arrays are memory mapped,
+    so only the parts of them that are looked up are read from disk'''
+
+    def __init__(self, data_folder):
+        folder = os.path.join(data_folder, bundle_folder)
+        load = lambda name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode='r')
+        self.line_offsets = load("line_offsets")
+        self.source_offsets = load("source_offsets")
+        self.source_tokens = load("source_tokens")
+        self.target_offsets = load("target_offsets")
+        self.target_tokens = load("target_tokens")
+        self.vocab_offsets = load("vocab_offsets")
+        self.vocab_bytes = load("vocab_bytes")
+        self.pairs = load("pairs")
+        self.pair_offsets = load("pair_offsets")
+        self.vref_keys = load("vref_keys")
+        self.vref_slots = load("vref_slots")
+
+    def __len__(self):
+        return len(self.vref_keys)
+
+    def row_of(self, vref):
+        '''Line number of the verse in the text files. Raises KeyError if it is not there'''
+        key = vref_key(vref)
+        mask = len(self.vref_slots) - 1
+        slot = slot_of(key, mask)
+        while self.vref_slots[slot] != EMPTY_SLOT:
+            row = int(self.vref_slots[slot])
+            if self.vref_keys[row] == key:
+                return row
+            slot = (slot + 1) & mask
+        raise KeyError(vref)
+
+    def vref(self, row):
+        return key_vref(int(self.vref_keys[row]))
+
+    def word(self, token):
+        return bytes(self.vocab_bytes[self.vocab_offsets[token]:self.vocab_offsets[token + 1]]).decode('utf-8')
+
+    def source_ids(self, row):
+        return self.source_tokens[self.source_offsets[row]:self.source_offsets[row + 1]]
+
+    def target_ids(self, row):
+        return self.target_tokens[self.target_offsets[row]:self.target_offsets[row + 1]]
+
+    def source(self, row):
+        return " ".join(self.word(token) for token in self.source_ids(row))
+
+    def target(self, row):
+        return " ".join(self.word(token) for token in self.target_ids(row))
+
+    def alignment(self, row):
+        '''(source, target) word number pairs of the verse, counting from 1'''
+        return self.pairs[self.pair_offsets[row]:self.pair_offsets[row + 1]]
+
+    def verse(self, vref):
+        row = self.row_of(vref)
+        return Verse(vref, self.source(row), self.target(row), self.alignment(row))
@@ -0,0 +1,161 @@
+'''Incremental builds, regenerating only the outputs of the books whose rows changed since the last build.
+A manifest in the output folder records a digest of the rows of each book and of each output file'''
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from outputs import write_if_changed
+from parallel import book_row_ranges, books_are_contiguous, books_lines, pending_before, process_books
+from processAlignment import save_output_lines
+from sheetcache import file_digest
+
+MANIFEST_FILE = "build_manifest.json"
+MANIFEST_VERSION = 1
+SCRIPTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+def code_digest():
+    '''Digest of the scripts, as a change in them can change any of the outputs'''
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(SCRIPTS_FOLDER)):
+        if name.endswith(".py"):
+            with open(os.path.join(SCRIPTS_FOLDER, name), 'rb') as script:
+                digest.update(name.encode())
+                digest.update(script.read())
+    return digest.hexdigest()
+
+def rows_digest(rows_df, columns):
+    '''Digest of the values in the given columns of the rows'''
+    columns = [col for col in columns if col in rows_df.columns]
+    digest = hashlib.sha256("\0".join(columns).encode())
+    digest.update(pd.util.hash_pandas_object(rows_df[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def output_digest(path):
+    return file_digest(path) if os.path.exists(path) else None
+
+def load_manifest(output_folder):
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("code") != code_digest():
+        print("Scripts changed since the last build. Rebuilding everything")
+        return {}
+    return manifest.get("stages", {})
+
+def save_manifest(output_folder, stages):
+    path = os.path.join(output_folder, MANIFEST_FILE)
+    write_if_changed(path, json.dumps({"version": MANIFEST_VERSION, "code": code_digest(), "stages": stages},
+                                      indent=1, sort_keys=True))
+
+def build_book_files(stage, filepath, excel_sheet, header_row, stage_folder,
+                     bsb_df, verse_index, book_ranges, previous, jobs=1):
+    '''Stages writing one file per book: regenerate the files of changed books only'''
+    old_books = previous.get("books", {})
+    books = {}
+    changed = []
+    for book, rows in book_ranges:
+        digest = rows_digest(bsb_df.iloc[rows], stage.columns)
+        path = os.path.join(stage_folder, stage.book_file.format(book))
+        entry = old_books.get(book)
+        if entry and entry["rows"] == digest and entry["output"] == output_digest(path):
+            books[book] = entry
+            continue
+        books[book] = {"rows": digest}
+        changed.append((book, rows))
+        # A book may not produce a file any more, eg: when it has no Hebrew words left
+        if os.path.exists(path):
+            os.remove(path)
+    for book in old_books.keys() - books.keys():
+        path = os.path.join(stage_folder, stage.book_file.format(book))
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"{len(changed)} of {len(book_ranges)} books changed")
+    process_books(stage.processor, filepath, excel_sheet, header_row, stage_folder,
+                  bsb_df, verse_index, [rows for _, rows in changed], jobs)
+    for book, _ in changed:
+        books[book]["output"] = output_digest(os.path.join(stage_folder, stage.book_file.format(book)))
+    return {"books": books}
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as in_file:
+        content = in_file.read()
+    return content.split("\n") if content else []
+
+def build_book_lines(stage, filepath, excel_sheet, header_row, stage_folder,
+                     bsb_df, verse_index, book_ranges, previous, jobs=1):
+    '''Stages writing parallel files with one line per verse: regenerate the lines of
+    changed books only, and splice them between the unchanged lines of the other books.
+    A book also changes when the pending state that the books before it leave changes'''
+    paths = {file_name: os.path.join(stage_folder, file_name) for file_name in stage.output_files}
+    old_books = previous.get("books", {})
+    old_lines = {}
+    if old_books and all(previous.get("outputs", {}).get(name) == output_digest(path)
+                         for name, path in paths.items()):
+        old_lines = {name: read_lines(path) for name, path in paths.items()}
+
+    digests = {}
+    pendings = {}
+    book_lines = {}
+    changed = []
+    for book, rows in book_ranges:
+        digests[book] = rows_digest(bsb_df.iloc[rows], stage.columns)
+        pendings[book] = pending_before(stage.processor, filepath, excel_sheet, header_row,
+                                        bsb_df, verse_index, rows.start)
+        entry = old_books.get(book)
+        if old_lines and entry and entry["rows"] == digests[book] and entry.get("pending") == pendings[book]:
+            first, count = entry["lines"]
+            book_lines[book] = {name: old_lines[name][first:first + count] for name in stage.output_files}
+        else:
+            changed.append((book, rows))
+    results = books_lines(stage.processor, filepath, excel_sheet, header_row, bsb_df, verse_index,
+                          [rows for _, rows in changed], [pendings[book] for book, _ in changed], jobs)
+    book_lines.update(zip([book for book, _ in changed], results))
+    print(f"{len(changed)} of {len(book_ranges)} books changed")
+
+    lines = {name: [] for name in stage.output_files}
+    books = {}
+    for book, _ in book_ranges:
+        first = len(lines[stage.output_files[0]])
+        for name in stage.output_files:
+            lines[name].extend(book_lines[book][name])
+        books[book] = {"rows": digests[book], "pending": pendings[book],
+                       "lines": [first, len(lines[stage.output_files[0]]) - first]}
+
+    if changed or len(books) != len(old_books) or not old_lines:
+        save_output_lines(stage_folder, lines)
+    return {"books": books, "outputs": {name: output_digest(path) for name, path in paths.items()}}
+
+def build_whole(stage, filepath, excel_sheet, header_row, stage_folder, bsb_df, verse_index, previous):
+    '''Other stages: run only if any of their columns changed anywhere in the sheet'''
+    digest = rows_digest(bsb_df, stage.columns)
+    paths = {file_name: os.path.join(stage_folder, file_name) for file_name in stage.output_files}
+    if previous.get("rows") == digest and \
+            all(previous.get("outputs", {}).get(name) == output_digest(path) for name, path in paths.items()):
+        print("Unchanged")
+        return previous
+    kwargs = {"verse_index": verse_index} if stage.uses_verse_index else {}
+    stage.processor(filepath, excel_sheet, header_row, stage_folder, bsb_df=bsb_df, **kwargs)
+    return {"rows": digest, "outputs": {name: output_digest(path) for name, path in paths.items()}}
+
+def build_stage(stage, filepath, excel_sheet, header_row, stage_folder, bsb_df, verse_index,
+                previous, jobs=1):
+    '''Build one stage incrementally, given its entry of the previous manifest.
+    Returns the entry to record for it in the new manifest'''
+    if not (stage.book_file or stage.book_lines):
+        return build_whole(stage, filepath, excel_sheet, header_row, stage_folder,
+                           bsb_df, verse_index, previous)
+    book_ranges = book_row_ranges(verse_index)
+    if not books_are_contiguous(book_ranges):
+        print("Books are not contiguous in the sheet. Rebuilding the whole stage")
+        stage.processor(filepath, excel_sheet, header_row, stage_folder, bsb_df=bsb_df, verse_index=verse_index)
+        return {}
+    if stage.book_file:
+        return build_book_files(stage, filepath, excel_sheet, header_row, stage_folder,
+                                bsb_df, verse_index, book_ranges, previous, jobs)
+    return build_book_lines(stage, filepath, excel_sheet, header_row, stage_folder,
+                            bsb_df, verse_index, book_ranges, previous, jobs)
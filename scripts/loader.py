@@ -0,0 +1,233 @@
+'''Loading of the interlinear sheet from the input XLSX file, or from a CSV, TSV or Parquet export of it,
+as a whole or as a stream of rows'''
+
+import csv
+import os
+import re
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pyarrow import csv as arrow_csv, parquet
+
+import sheetcache
+from schema import apply_schema
+from refindex import ref_pattern
+
+# Input formats by file extension. CSV and TSV files are exports of the sheet with the same rows,
+# so the header is on the same row as in the XLSX file. Parquet files have the header as column names
+input_formats = {".xlsx": "xlsx", ".xlsm": "xlsx", ".csv": "csv", ".tsv": "tsv", ".parquet": "parquet"}
+delimiters = {"csv": ",", "tsv": "\t"}
+
+def sheet_format(filepath, input_format=None):
+    '''The given input format, or the one of the file extension'''
+    if input_format is None:
+        input_format = input_formats.get(os.path.splitext(filepath)[1].lower())
+        if input_format is None:
+            raise ValueError(f"Unknown input file type of {filepath}. "
+                             f"Expected one of: {', '.join(input_formats)}")
+    if input_format not in input_formats.values():
+        raise ValueError(f"Unknown input format {input_format!r}")
+    return input_format
+
+def load_bsb_sheet(filepath, excel_sheet, header_row, use_cache=True, refresh_cache=False, columns=None,
+                   input_format=None):
+    '''Read the sheet once, so that the same frame can be shared by all processors.
+    The parsed XLSX sheet is cached on disk, keyed by the workbook contents, unless use_cache is False.
+    CSV, TSV and Parquet files are read with the multithreaded Arrow readers, which are fast enough
+    not to need the cache. Only the given columns are loaded, or all if columns is None,
+    with the compact dtypes of schema.py'''
+    def read_sheet(usecols=None):
+        return pd.read_excel(filepath, sheet_name=excel_sheet, header=header_row, usecols=usecols)
+    file_format = sheet_format(filepath, input_format)
+    if file_format != "xlsx":
+        bsb_df = read_arrow(filepath, file_format, header_row, columns)
+    elif use_cache:
+        # The whole sheet is cached, so that one entry serves any selection of columns
+        bsb_df = sheetcache.load_cached(filepath, excel_sheet, header_row, read_sheet,
+                                        refresh=refresh_cache, columns=columns)
+    else:
+        bsb_df = read_sheet(columns)
+    # Rows empty in all the loaded columns contribute nothing to the outputs using them
+    bsb_df = bsb_df.dropna(how='all', axis=0)
+    return apply_schema(bsb_df)
+
+def read_header(filepath, header_row, delimiter):
+    '''Column names of a CSV or TSV file, from its row header_row, as read_excel gives them'''
+    with open(filepath, encoding='utf-8-sig', newline='') as in_file:
+        records = csv.reader(in_file, delimiter=delimiter)
+        for _ in range(header_row):
+            next(records, None)
+        return column_names(next(records, []))
+
+def read_arrow(filepath, file_format, header_row, columns=None):
+    '''Read a CSV, TSV or Parquet file with the multithreaded Arrow readers, into a frame like read_excel gives'''
+    if file_format == "parquet":
+        names = parquet.read_schema(filepath).names
+    else:
+        names = read_header(filepath, header_row, delimiters[file_format])
+    missing = [col for col in columns or [] if col not in names]
+    if missing:
+        raise KeyError(f"Columns not found in {filepath}: {missing}")
+    if file_format == "parquet":
+        table = parquet.read_table(filepath, columns=columns, use_threads=True)
+    else:
+        table = arrow_csv.read_csv(
+            filepath,
+            read_options=arrow_csv.ReadOptions(skip_rows=header_row + 1, column_names=names, use_threads=True),
+            # Quoted cells can span lines, like the notes of the Footnotes column
+            parse_options=arrow_csv.ParseOptions(delimiter=delimiters[file_format], newlines_in_values=True),
+            convert_options=arrow_csv.ConvertOptions(include_columns=columns, null_values=NA_STRINGS,
+                                                     strings_can_be_null=True))
+    return sheetcache.restore_missing(table.to_pandas().reset_index(drop=True))
+
+# Cell texts that read_excel treats as missing values, the default na_values of pandas
+NA_STRINGS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+              'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# The same, for looking up the cells of streamed rows
+NA_STRING_SET = frozenset(NA_STRINGS)
+
+class SheetRow:
+    '''A light weight row of the sheet, holding only the requested columns.
+    Columns are accessed by name, like on the rows of the DataFrame: row['Verse'].
+    number is the position of the row under the header, the label it has in the frame of load_bsb_sheet'''
+    __slots__ = ("values", "positions", "number")
+
+    def __init__(self, values, positions, number=None):
+        self.values = values
+        self.positions = positions
+        self.number = number
+
+    def __getitem__(self, col):
+        return self.values[self.positions[col]]
+
+    def replace(self, col, value):
+        '''A copy of the row with the value of col changed'''
+        values = list(self.values)
+        values[self.positions[col]] = value
+        return SheetRow(tuple(values), self.positions, self.number)
+
+    def __repr__(self):
+        return "SheetRow(" + ", ".join(f"{col!r}: {self.values[pos]!r}"
+                                      for col, pos in self.positions.items()) + ")"
+
+def convert_cell(value):
+    '''Convert a cell value the same way read_excel does'''
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in NA_STRING_SET:
+        return np.nan
+    return value
+
+int_pattern = re.compile(r'^[+-]?\d+$')
+float_pattern = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+
+def convert_text(value):
+    '''Convert a field of a CSV or TSV file to the value read_excel gives for the cell it was exported from'''
+    if value == "" or value in NA_STRING_SET:
+        return np.nan
+    if int_pattern.match(value):
+        return int(value)
+    if float_pattern.match(value):
+        return convert_cell(float(value))
+    return value
+
+def column_names(header):
+    '''Column names as read_excel gives them, for unnamed and repeated header cells'''
+    names = []
+    seen = {}
+    for index, name in enumerate(header):
+        name = f"Unnamed: {index}" if name is None or name == "" else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def xlsx_records(filepath, excel_sheet):
+    '''Cell values of each row of the sheet, with the workbook opened in read only mode'''
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        sheet = workbook[excel_sheet]
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def text_records(filepath, delimiter):
+    '''Fields of each row of a CSV or TSV file'''
+    with open(filepath, encoding='utf-8-sig', newline='') as in_file:
+        yield from csv.reader(in_file, delimiter=delimiter)
+
+# Rows of a Parquet file converted to Python values at a time when it is streamed
+PARQUET_BATCH_ROWS = 8192
+
+def parquet_records(filepath, columns):
+    '''The names of the given columns present in a Parquet file, and then their values in each row.
+    The rows are read in batches, and only these columns are read'''
+    parquet_file = parquet.ParquetFile(filepath)
+    present = [col for col in columns if col in parquet_file.schema_arrow.names]
+    yield present
+    for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=present):
+        yield from zip(*(batch.column(col).to_pylist() for col in present))
+
+def iter_bsb_rows(filepath, excel_sheet, header_row, columns, input_format=None):
+    '''Stream the rows of the sheet as SheetRows with only the given columns,
+    without loading the whole sheet into memory. Rows empty in all of these columns are skipped,
+    but still counted in the numbers of the next rows'''
+    file_format = sheet_format(filepath, input_format)
+    convert = convert_cell
+    if file_format == "parquet":
+        records = parquet_records(filepath, columns)
+    else:
+        if file_format == "xlsx":
+            records = xlsx_records(filepath, excel_sheet)
+        else:
+            records = text_records(filepath, delimiters[file_format])
+            convert = convert_text
+        for _ in range(header_row):
+            next(records, None)
+    try:
+        names = column_names(next(records, ()))
+        missing = [col for col in columns if col not in names]
+        if missing:
+            raise KeyError(f"Columns not found in {filepath}: {missing}")
+        cell_indices = [names.index(col) for col in columns]
+        positions = {col: pos for pos, col in enumerate(columns)}
+        # Empty lines of CSV and TSV files are not rows of the sheet, as the Arrow reader skips them
+        for number, row in enumerate(row for row in records if convert is not convert_text or row):
+            values = tuple(convert(row[index]) if index < len(row) else np.nan
+                           for index in cell_indices)
+            if all(value is np.nan for value in values):
+                continue
+            yield SheetRow(values, positions, number)
+    finally:
+        records.close()
+
+def rows_frame(rows, columns):
+    '''Frame of streamed rows, labelled with their numbers like the rows of the frame of load_bsb_sheet'''
+    return pd.DataFrame([row.values for row in rows], columns=columns, index=[row.number for row in rows])
+
+def iter_book_slices(rows):
+    '''Group streamed rows into one list per book, with the Verse filled forward
+    into the rows of each verse'''
+    book_rows = []
+    current_book = None
+    current_verse = np.nan
+    for row in rows:
+        if not pd.isna(row['Verse']):
+            current_verse = row['Verse']
+            book_name = re.match(ref_pattern, current_verse).group(1)
+            if book_name != current_book and book_rows:
+                yield book_rows
+                book_rows = []
+            current_book = book_name
+        else:
+            row = row.replace('Verse', current_verse)
+        book_rows.append(row)
+    if book_rows:
+        yield book_rows
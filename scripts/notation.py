@@ -0,0 +1,69 @@
+'''Tokenizer for the special notations in the BSB Version cells, shared by the processors:
+- (not aligned), [added text], {text not aligned}, . . . (aligned up), vvv (aligned down)'''
+
+import re
+from functools import lru_cache
+
+# Token kinds
+WORD = "word"            # text aligned to the source word of the row
+TEXT = "text"            # text without any word characters, between bracketed notations
+ADD = "add"              # [] enclosed text, added in translation
+PLAIN = "plain"          # {} enclosed text
+UNALIGNED = "unaligned"  # the whole cell, when it has a - without words around it
+ALIGN_UP = "align_up"    # . . . the source word goes with the previous English words
+ALIGN_DOWN = "align_down"  # vvv the source word goes with the next English words
+
+# The same short cells repeat all over the sheet, so the tokens of the most recent ones are kept
+CACHE_SIZE = 65536
+
+null_align_pattern = re.compile(r'\B\-\B') # - without word surrounding it
+add_text_pattern = re.compile(r'\[[^\]]+\]') # [] enclosed text
+curly_brace_pattern = re.compile(r'\{[^\}]*\}') # {} enclosed text
+bracket_pattern = re.compile(r'\[[^\]]+\]|\{[^\}]*\}') # [] or {} enclosed text
+word_pattern = re.compile(r'\w')
+
+def split_notations(cell_text, pattern):
+    '''Tokens of a cell split on the bracketed notations of the pattern, or an empty tuple if it has none.
+    Other text in the cell, brackets included, is kept in the WORD and TEXT tokens between them'''
+    tokens = []
+    position = 0
+    for match in pattern.finditer(cell_text):
+        text = cell_text[position:match.start()]
+        tokens.append((WORD if word_pattern.search(text) else TEXT, text))
+        notation = match.group()
+        tokens.append((ADD if notation[0] == "[" else PLAIN, notation[1:-1]))
+        position = match.end()
+    if tokens:
+        text = cell_text[position:]
+        if text.strip() != "":
+            tokens.append((WORD if word_pattern.search(text) else TEXT, text))
+    return tuple(tokens)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def tokenize(cell_text):
+    '''Split a BSB Version cell into a tuple of (kind, text) tokens, as the alignment reads it:
+    split on both [] and {}, which take precedence over . . . and vvv.
+    The text of ADD and PLAIN tokens is without the brackets'''
+    if null_align_pattern.search(cell_text):
+        return ((UNALIGNED, null_align_pattern.sub("", cell_text).strip()),)
+    tokens = split_notations(cell_text, bracket_pattern)
+    if tokens:
+        return tokens
+    if ". . ." in cell_text:
+        return ((ALIGN_UP, cell_text),)
+    if "vvv" in cell_text:
+        return ((ALIGN_DOWN, cell_text),)
+    return ((WORD, cell_text),)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def tokenize_usfm(cell_text):
+    '''The tokens of a BSB Version cell as the BSB USFM files render it: . . . and vvv take precedence
+    over the brackets, and a cell with [] is split on those only, keeping any {} in its words'''
+    if null_align_pattern.search(cell_text):
+        return ((UNALIGNED, null_align_pattern.sub("", cell_text).strip()),)
+    if ". . ." in cell_text:
+        return ((ALIGN_UP, cell_text),)
+    if "vvv" in cell_text:
+        return ((ALIGN_DOWN, cell_text),)
+    return split_notations(cell_text, add_text_pattern) or split_notations(cell_text, curly_brace_pattern) \
+        or ((WORD, cell_text),)
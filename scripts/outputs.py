@@ -0,0 +1,102 @@
+'''Writing of the output files on a background thread, so that the disk writes overlap with
+rendering the next outputs. Files whose content did not change are left as they are, and
+changed ones are written to a temporary file first and renamed over the old one'''
+
+import os
+import queue
+import threading
+
+import profiling
+
+# Outputs waiting to be written, at most. Rendering waits when the writer falls this far behind
+QUEUE_SIZE = 8
+# Bytes compared at a time between a file written in parts and the one it replaces
+BLOCK_SIZE = 1 << 20
+
+def same_content(path, content):
+    '''True if the file at path has exactly this content'''
+    try:
+        if os.path.getsize(path) != len(content):
+            return False
+        with open(path, 'rb') as existing:
+            return existing.read() == content
+    except OSError:
+        return False
+
+def write_if_changed(path, content):
+    '''Write the content, str or bytes, to path unless the file already has it.
+    Returns True if the file was written'''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if same_content(path, content):
+        return False
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as out_file:
+        out_file.write(content)
+    os.replace(temp_path, path)
+    return True
+
+def same_files(path, other_path):
+    '''True if the two files have exactly the same content, compared a block at a time'''
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        with open(path, 'rb') as one, open(other_path, 'rb') as other:
+            while True:
+                block = one.read(BLOCK_SIZE)
+                if block != other.read(BLOCK_SIZE):
+                    return False
+                if not block:
+                    return True
+    except OSError:
+        return False
+
+def replace_if_changed(temp_path, path):
+    '''Move a file written in parts at temp_path over path, unless path already has its content,
+    in which case the temporary file is removed. Returns True if path was replaced'''
+    if same_files(temp_path, path):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+class OutputSink:
+    '''Queue of files to write, drained by a writer thread. close() waits for all of them
+    to be written, and raises the first error of the writer if there was one'''
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.error = None
+        self.written = 0
+        self.unchanged = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            path, content = item
+            try:
+                with profiling.writing():
+                    if write_if_changed(path, content):
+                        self.written += 1
+                    else:
+                        self.unchanged += 1
+            except Exception as exce:
+                self.error = exce
+
+    def write(self, path, content):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((path, content))
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,115 @@
+'''Running a processor on each book separately, in a pool of worker processes'''
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from processAlignment import output_files as line_files, save_output_lines
+from refindex import book_codes
+
+def book_row_ranges(verse_index):
+    '''(book code, positional slice of rows) for each contiguous run of rows of one book.
+    Rows before the first verse go with the first book'''
+    row_book = verse_index.book_id[np.maximum(verse_index.row_verse, 0)]
+    if len(row_book) == 0:
+        return []
+    run_starts = np.flatnonzero(np.diff(row_book)) + 1
+    bounds = [0, *run_starts.tolist(), len(row_book)]
+    return [(book_codes[row_book[start]], slice(start, stop))
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def process_book(processor, filepath, excel_sheet, header_row, output_folder, book_df, verse_index):
+    processor(filepath, excel_sheet, header_row, output_folder, bsb_df=book_df, verse_index=verse_index)
+
+def books_are_contiguous(book_ranges):
+    '''False if the rows of some book are split in more than one run'''
+    book_list = [book for book, _ in book_ranges]
+    return len(set(book_list)) == len(book_list)
+
+def process_books(processor, filepath, excel_sheet, header_row, output_folder,
+                  bsb_df, verse_index, row_ranges, jobs=1):
+    '''Run the processor on each of the positional row ranges of books separately,
+    in jobs worker processes if jobs > 1'''
+    if jobs <= 1:
+        for rows in row_ranges:
+            process_book(processor, filepath, excel_sheet, header_row, output_folder,
+                         bsb_df.iloc[rows], verse_index.subset(rows))
+        return
+    # Larger books first, so that they do not end up last on a busy pool
+    row_ranges = sorted(row_ranges, key=lambda rows: rows.start - rows.stop)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(process_book, processor, filepath, excel_sheet, header_row,
+                                   output_folder, bsb_df.iloc[rows], verse_index.subset(rows))
+                   for rows in row_ranges]
+        for future in futures:
+            future.result()
+
+def process_books_in_parallel(processor, filepath, excel_sheet, header_row, output_folder,
+                              bsb_df, verse_index, jobs):
+    '''Run the processor on the rows of each book in a separate worker process.
+    Each book is written to its own file, so the output is the same as that of one run over all rows'''
+    book_ranges = book_row_ranges(verse_index)
+    if not books_are_contiguous(book_ranges):
+        # The later rows of a book would overwrite its file, which needs the serial order
+        print("Books are not contiguous in the sheet. Processing them serially")
+        processor(filepath, excel_sheet, header_row, output_folder, bsb_df=bsb_df, verse_index=verse_index)
+        return
+    process_books(processor, filepath, excel_sheet, header_row, output_folder, bsb_df, verse_index,
+                  [rows for _, rows in book_ranges], jobs)
+
+def book_lines(processor, filepath, excel_sheet, header_row, book_df, verse_index, pending=None):
+    '''Output lines of a processor writing parallel files, like ProcessAlignment, for the rows of one book,
+    starting from the pending state that the rows before them left'''
+    return processor(filepath, excel_sheet, header_row, None,
+                     bsb_df=book_df, verse_index=verse_index, pending=pending).align_table.output_lines()
+
+def pending_before(processor, filepath, excel_sheet, header_row, bsb_df, verse_index, start):
+    '''The pending state of a processor writing parallel files, like ProcessAlignment, at the positional
+    row start, as a run over all the rows before it leaves it. The state after a verse with BSB words no
+    longer depends on the rows before that verse, so only the last verses before start are processed,
+    back to one with words'''
+    if start == 0:
+        return None
+    verse_starts = np.flatnonzero(bsb_df['Verse'].iloc[:start].notna().to_numpy())
+    for tail_start in [*verse_starts[::-1].tolist(), 0]:
+        rows = slice(tail_start, start)
+        tail = processor(filepath, excel_sheet, header_row, None,
+                         bsb_df=bsb_df.iloc[rows], verse_index=verse_index.subset(rows))
+        if tail_start == 0 or any(tail.align_table.source):
+            return tail.pending()
+
+def books_lines(processor, filepath, excel_sheet, header_row, bsb_df, verse_index, row_ranges, pendings,
+                jobs=1):
+    '''Output lines of each of the positional row ranges of books, in the order of the ranges, each starting
+    from its pending state. The books are processed in jobs worker processes if jobs > 1'''
+    if jobs <= 1:
+        return [book_lines(processor, filepath, excel_sheet, header_row, bsb_df.iloc[rows], verse_index.subset(rows),
+                           pending)
+                for rows, pending in zip(row_ranges, pendings)]
+    # Larger books are submitted first, and the results collected in the order of the ranges
+    order = sorted(range(len(row_ranges)), key=lambda number: row_ranges[number].start - row_ranges[number].stop)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {number: executor.submit(book_lines, processor, filepath, excel_sheet, header_row,
+                                           bsb_df.iloc[row_ranges[number]], verse_index.subset(row_ranges[number]),
+                                           pendings[number])
+                   for number in order}
+        return [futures[number].result() for number in range(len(row_ranges))]
+
+def process_book_lines_in_parallel(processor, filepath, excel_sheet, header_row, output_folder,
+                                   bsb_df, verse_index, jobs):
+    '''Run a processor writing parallel files on the rows of each book in a separate worker process,
+    and write the lines of the books one after the other, in the order of the sheet.
+    Each book starts from the pending state the previous books left, worked out from their last verses,
+    so the output is the same as that of one run over all rows'''
+    book_ranges = book_row_ranges(verse_index)
+    if not books_are_contiguous(book_ranges):
+        # A verse given again in a later run of its book replaces its earlier lines, which needs the serial order
+        print("Books are not contiguous in the sheet. Processing them serially")
+        processor(filepath, excel_sheet, header_row, output_folder, bsb_df=bsb_df, verse_index=verse_index)
+        return
+    row_ranges = [rows for _, rows in book_ranges]
+    pendings = [pending_before(processor, filepath, excel_sheet, header_row, bsb_df, verse_index, rows.start)
+                for rows in row_ranges]
+    results = books_lines(processor, filepath, excel_sheet, header_row, bsb_df, verse_index, row_ranges, pendings, jobs)
+    save_output_lines(output_folder, {name: [line for lines in results for line in lines[name]]
+                                      for name in line_files})
@@ -1,62 +1,164 @@
 '''Scripts to extract the Alignment data from the input XLSX/CSV file in pharaoh format'''
 
-import re
-import glob
+from array import array
+import os
 import pandas as pd
 import numpy as np
 
-from utils import book_name_code_map
+import notation
+import profiling
+from outputs import OutputSink, replace_if_changed
+from corpus import BundleBuilder, save_bundle
+from loader import load_bsb_sheet, iter_bsb_rows
+from refindex import VerseIndex
+from tokens import target_col
 
-target_col = 'WLC / Nestle Base {TR} ⧼RP⧽ (WH) 〈NE〉 [NA] ‹SBL› [[ECM]]'
+sheet_columns = ['Verse', 'Heb Sort', 'Grk Sort', target_col, 'BSB Version']
+output_files = ["bsb_text.txt", "heb_grk_text.txt", "bsb_to_heb_or_grk_alignment.txt", "vref.txt"]
+
+class AlignmentTable:
+    '''Columnar accumulator of the verse texts and alignments. Alignment pairs of all verses
+    are kept in two flat integer arrays, and each verse has the range of its pairs in them'''
+    def __init__(self):
+        self.vrefs = []
+        self.source = []
+        self.target = []
+        self.pair_start = array('q')
+        self.pair_stop = array('q')
+        self.src_indices = array('i')
+        self.trg_indices = array('i')
+        self.position_of = {}
+
+    def add_pair(self, src_index, trg_index):
+        self.src_indices.append(src_index)
+        self.trg_indices.append(trg_index)
+
+    def pair_count(self):
+        return len(self.src_indices)
+
+    def add_verse(self, vref, source, target, pair_start):
+        '''Add a verse, with the pairs added since pair_start.
+        A reference seen again replaces the earlier data but keeps its position'''
+        pair_stop = len(self.src_indices)
+        if vref in self.position_of:
+            position = self.position_of[vref]
+            self.source[position] = source
+            self.target[position] = target
+            self.pair_start[position] = pair_start
+            self.pair_stop[position] = pair_stop
+        else:
+            self.position_of[vref] = len(self.vrefs)
+            self.vrefs.append(vref)
+            self.source.append(source)
+            self.target.append(target)
+            self.pair_start.append(pair_start)
+            self.pair_stop.append(pair_stop)
+
+    def alignment_lines(self):
+        '''Pharaoh format alignment of each verse, formatted in one go'''
+        pairs = [f"{src}-{trg}" for src, trg in zip(self.src_indices, self.trg_indices)]
+        return [" ".join(pairs[start:stop]) for start, stop in zip(self.pair_start, self.pair_stop)]
+
+    def output_lines(self):
+        '''Lines of each output file, one line per verse in all of them'''
+        return dict(zip(output_files, [self.source, self.target, self.alignment_lines(), self.vrefs]))
+
+    def save(self, data_folder):
+        save_output_lines(data_folder, self.output_lines())
+
+def save_output_lines(data_folder, lines):
+    '''Write the text files with the lines of AlignmentTable.output_lines(), and the binary bundle of the same data'''
+    sink = OutputSink()
+    for file_name, file_lines in lines.items():
+        sink.write(f"{data_folder}/{file_name}", "\n".join(file_lines))
+    save_bundle(data_folder, lines, sink)
+    sink.close()
+
+class OutputLinesWriter:
+    '''Writes the lines of AlignmentTable.output_lines() of consecutive parts of the sheet, like its books,
+    to the text files as they are made, and saves the bundle of all of them at close(). Only the arrays of
+    the bundle are kept across the parts. The files are the same as save_output_lines() writes for all the lines'''
+
+    def __init__(self, data_folder):
+        os.makedirs(data_folder, exist_ok=True)
+        self.data_folder = data_folder
+        self.paths = [os.path.join(data_folder, file_name) for file_name in output_files]
+        self.out_files = [open(f"{path}.tmp", 'w', encoding='utf-8', newline='') for path in self.paths]
+        self.line_count = 0
+        self.bundle = BundleBuilder()
+
+    def write(self, lines):
+        for out_file, file_lines in zip(self.out_files, lines.values()):
+            if self.line_count and file_lines:
+                out_file.write("\n")
+            out_file.write("\n".join(file_lines))
+        self.line_count += len(lines[output_files[-1]])
+        self.bundle.add(lines)
+
+    def close(self):
+        for out_file, path in zip(self.out_files, self.paths):
+            out_file.close()
+            replace_if_changed(f"{path}.tmp", path)
+        sink = OutputSink()
+        self.bundle.save(self.data_folder, sink)
+        sink.close()
 
 class ProcessAlignment:
     def __init__(self,
-                 filepath, excel_sheet, header_row,output_folder="berean-build/output"):
-        self.bsb_df = pd.read_excel(filepath, sheet_name=excel_sheet, header=header_row)
-        self.ref_pattern = re.compile(r'(\d? ?[\w ]+) (\d+):(\d+)')
-        self.null_align_pattern = re.compile(r'\B\-\B') # - without word surrounding it
-        self.add_text_pattern = re.compile(r'\[[^\]]+\]') # [] enclosed text
-        self.curly_brace_pattern = re.compile(r'\{[^\}]*\}') # {} enclosed text
-        self.curly_or_sq_barces = re.compile(r'\[[^\]]+\]|\{[^\}]*\}')
-        self.up_align_pattern = re.compile(r'\. \. \.')
-        self.down_align_pattern = re.compile(r'vvv')
-
-        self.align_df = pd.DataFrame( columns=["vref","source","target","alignment"])
-        self.align_df.set_index('vref', inplace=True)
-        
-        self.trg_start_indices = {}
-        self.get_trg_starts()
+                 filepath, excel_sheet, header_row,output_folder="berean-build/output", bsb_df=None,
+                 streaming=False, verse_index=None, pending=None, input_format=None):
+        '''pending is the . . . and vvv state that the rows before these ones left, as given by pending(),
+        for processing the rows of a part of the sheet the same as in a run over all of it.
+        The file is read in input_format, or the format of its extension'''
+        sheet_rows = lambda: iter_bsb_rows(filepath, excel_sheet, header_row, sheet_columns, input_format)
+        if streaming:
+            self.bsb_df = None
+        else:
+            if bsb_df is None:
+                bsb_df = load_bsb_sheet(filepath, excel_sheet, header_row, columns=sheet_columns,
+                                        input_format=input_format)
+            self.bsb_df = bsb_df
+        if verse_index is None:
+            verse_index = VerseIndex.from_rows(sheet_rows()) if streaming \
+                else VerseIndex.from_frame(self.bsb_df)
+        # Smallest target index in each verse, as Grk and heb are not given in actual order in excel
+        self.verse_index = verse_index
+
+        self.align_table = AlignmentTable()
 
+        self.verse_ordinal = -1
+        self.current_book = ""
+        self.trg_start_index = None
         self.current_ref = ""
         self.source_text = []
         self.target_text = {}
         self.src_word_count = 0
-        self.alignment = []
-        self.prev_src_indices = []
-        self.prev_trg_index = []
-        self.bsb_df.apply(lambda row: self.row2alignment(row), axis=1)
-        
-        self.save_output_files(output_folder)
+        self.verse_pair_start = 0
+        self.prev_src_indices, self.prev_trg_index = [list(indices) for indices in pending or ([], [])]
+        if streaming:
+            for row in sheet_rows():
+                self.row2alignment(row)
+        else:
+            self.bsb_df.apply(lambda row: self.row2alignment(row), axis=1)
+        self.save_verse()
+        if self.current_book != "":
+            profiling.book_done(self.current_book)
+
+        if output_folder is not None:
+            self.save_output_files(output_folder)
 
     def row2alignment(self, row):
         try:
             if not pd.isna(row['Verse']):
-                if self.current_ref != "":
-                    self.align_df.at[self.current_ref, "source"] = " ".join(self.source_text)
-                    self.target_text = dict(sorted(self.target_text.items()))
-                    target_text = " ".join(self.target_text.values())
-                    self.align_df.at[self.current_ref, "target"] = target_text
-                    self.align_df.at[self.current_ref, "alignment"] = " ".join(self.alignment)
-                    self.source_text = []
-                    self.target_text = {}
-                    self.alignment = []
-                    self.src_word_count = 0    
-                ref_match = re.match(self.ref_pattern, row['Verse'])
-                ref_book = ref_match.group(1)
-                ref_chapter = ref_match.group(2)
-                ref_verse = ref_match.group(3)
-                book_code = book_name_code_map[ref_book]
-                self.current_ref = f"{book_code} {ref_chapter}:{ref_verse}" 
+                self.save_verse()
+                self.verse_ordinal += 1
+                book_code = self.verse_index.book_code(self.verse_ordinal)
+                if book_code != self.current_book:
+                    if self.current_book != "":
+                        profiling.book_done(self.current_book)
+                    self.current_book = book_code
+                self.current_ref = self.verse_index.ref(self.verse_ordinal)
+                self.trg_start_index = int(self.verse_index.start[self.verse_ordinal])
             
             trg_word_count = None
             if not pd.isna(row[target_col]):
@@ -66,36 +168,41 @@ class ProcessAlignment:
                 elif row['Heb Sort'] != 999999:
                     self.target_text[row['Heb Sort']] = row[target_col]
                     target_index = int(row['Heb Sort'])
-                trg_word_count = target_index - self.trg_start_indices[self.current_ref] + 1
+                trg_word_count = target_index - self.trg_start_index + 1
     
             if not pd.isna(row["BSB Version"]):
-                cell_text = str(row['BSB Version'])
-                if re.search(self.null_align_pattern, cell_text):
-                    cell_text = re.sub(self.null_align_pattern, "", cell_text).strip()
-                    self.add_aligned_text_by_splitting(cell_text, trg_word_count=None)
-                elif re.search(self.add_text_pattern, cell_text) or re.search(self.curly_brace_pattern, cell_text):
-                    non_align_entries = re.findall(self.curly_or_sq_barces, cell_text)
-                    align_entries = re.split(self.curly_or_sq_barces, cell_text)
-                    while cell_text.strip() != "":
-                        if align_entries and cell_text.startswith(align_entries[0]):
-                            self.add_aligned_text_by_splitting(align_entries[0], trg_word_count)
-                            cell_text = cell_text.replace(align_entries[0], "", 1)
-                            align_entries.pop(0)
-                        if non_align_entries and cell_text.startswith(non_align_entries[0]):
-                            self.add_aligned_text_by_splitting(non_align_entries[0][1:-1], trg_word_count=None)
-                            cell_text = cell_text.replace(non_align_entries[0], "", 1)
-                            non_align_entries.pop(0)
-                elif re.search(self.up_align_pattern, cell_text):
-                    for idx in self.prev_src_indices:
-                        self.alignment.append(f"{idx}-{trg_word_count}")
-                elif re.search(self.down_align_pattern, cell_text):
-                    self.prev_trg_index.append(trg_word_count)
-                else:
-                    self.add_aligned_text_by_splitting(cell_text, trg_word_count)
+                for kind, text in notation.tokenize(str(row['BSB Version'])):
+                    if kind in (notation.WORD, notation.TEXT):
+                        self.add_aligned_text_by_splitting(text, trg_word_count)
+                    elif kind in (notation.ADD, notation.PLAIN, notation.UNALIGNED):
+                        self.add_aligned_text_by_splitting(text, trg_word_count=None)
+                    elif kind == notation.ALIGN_UP:
+                        if trg_word_count is not None:
+                            for idx in self.prev_src_indices:
+                                self.align_table.add_pair(idx, trg_word_count)
+                    elif kind == notation.ALIGN_DOWN:
+                        if trg_word_count is not None:
+                            self.prev_trg_index.append(trg_word_count)
         except Exception as exce:
             print(f"Issue at {row=}")
             print(exce)
 
+    def save_verse(self):
+        '''Add the completed verse to the alignment table'''
+        if self.current_ref != "":
+            self.target_text = dict(sorted(self.target_text.items()))
+            self.align_table.add_verse(self.current_ref, " ".join(self.source_text),
+                                       " ".join(self.target_text.values()), self.verse_pair_start)
+            self.source_text = []
+            self.target_text = {}
+            self.verse_pair_start = self.align_table.pair_count()
+            self.src_word_count = 0
+
+    def pending(self):
+        '''The state carried to the next rows: the BSB words of the last cell with words, which a . . .
+        aligns with, and the source words of the vvv cells since, which the next BSB words align with'''
+        return [list(self.prev_src_indices), list(self.prev_trg_index)]
+
     def add_aligned_text_by_splitting(self, text, trg_word_count):
         '''BSB cell can have more than one word. Split it to calculate pharaoh alignment'''
         words = text.split(" ")
@@ -109,37 +216,13 @@ class ProcessAlignment:
                 self.src_word_count += 1
                 self.prev_src_indices.append(self.src_word_count)
                 if trg_word_count is not None:
-                    self.alignment.append(f"{self.src_word_count}-{trg_word_count}")
+                    self.align_table.add_pair(self.src_word_count, trg_word_count)
                     for idx in self.prev_trg_index:
-                        self.alignment.append(f"{self.src_word_count}-{idx}")
+                        self.align_table.add_pair(self.src_word_count, idx)
         self.prev_trg_index = []
 
-    def get_trg_starts(self):
-        for index, row in self.bsb_df.iterrows():
-            if not pd.isna(row["Grk Sort"]) and row['Grk Sort'] != 0:
-                src_index = int(row["Grk Sort"])
-            elif not pd.isna(row["Heb Sort"]):
-                src_index = int(row["Heb Sort"])
-            if not pd.isna(row['Verse']):
-                ref_match = re.match(self.ref_pattern, row['Verse'])
-                ref_book = ref_match.group(1)
-                ref_chapter = ref_match.group(2)
-                ref_verse = ref_match.group(3)
-                book_code = book_name_code_map[ref_book]
-                current_verse = f"{book_code} {ref_chapter}:{ref_verse}"
-                self.trg_start_indices[current_verse] = src_index
-            if src_index < self.trg_start_indices[current_verse]:
-                self.trg_start_indices[current_verse] = src_index
-
     def save_output_files(self, data_folder):
-        with open(f"{data_folder}/bsb_text.txt", 'w', encoding='utf-8') as src_text_file:
-            src_text_file.write("\n".join(self.align_df['source']))
-        with open(f"{data_folder}/heb_grk_text.txt", 'w', encoding='utf-8') as trg_text_file:
-            trg_text_file.write("\n".join(self.align_df['target']))
-        with open(f"{data_folder}/bsb_to_heb_or_grk_alignment.txt", 'w', encoding='utf-8') as align_file:
-            align_file.write("\n".join(self.align_df['alignment']))
-        with open(f"{data_folder}/vref.txt", 'w', encoding='utf-8') as vref_file:
-            vref_file.write("\n".join(self.align_df.index))
+        self.align_table.save(data_folder)
 
 if __name__== '__main__':
     input_excel = 'input/bsb_tables.xlsx'
@@ -0,0 +1,64 @@
+'''Scripts to extract the concordance of the Strongs numbers from the input XLSX/CSV file'''
+
+import numpy as np
+import pandas as pd
+
+from concordance import ConcordanceBuilder, occurrence_dtypes, strong_key
+from outputs import OutputSink
+from tokens import token_parts
+
+sheet_columns = ['Verse', 'Heb Sort', 'Grk Sort', 'Language', 'Strongs', 'BSB Version']
+
+class ProcessConcordance:
+    def __init__(self, filepath, excel_sheet, header_row, output_folder="output", bsb_df=None,
+                 streaming=False, verse_index=None, tokens=None, input_format=None):
+        '''The concordance is taken from the token table of tokens.py, which can be passed in
+        if already built for the same rows, together with their verse_index.
+        When streaming, the table is built one book at a time'''
+        parts, _ = token_parts(filepath, excel_sheet, header_row, sheet_columns, bsb_df, streaming, verse_index, tokens,
+                               input_format)
+        writer = ConcordanceWriter(output_folder)
+        for part in parts:
+            writer.write(part)
+        writer.close()
+
+class ConcordanceWriter:
+    '''Collects the occurrences of the token tables of consecutive parts of the sheet, like its books or
+    the chunks of a build, and saves the concordance of all of them at close()'''
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.builder = ConcordanceBuilder()
+
+    def write(self, tokens):
+        self.builder.add(*self.tokens2concordance(tokens))
+
+    def close(self):
+        sink = OutputSink()
+        key_count = self.builder.save(self.output_folder, sink)
+        sink.close()
+        print(f"Saves the concordance of {key_count} Strongs numbers")
+
+    def tokens2concordance(self, tokens):
+        '''Key, verse, word number and English phrase of each word with a Strongs number,
+        for all words at once, in their source order'''
+        tokens = tokens[tokens["strong"].notna()]
+        initials, initial_ids = np.unique(tokens["strong"].str[0].to_numpy(dtype=str), return_inverse=True)
+        initial_keys = np.array([strong_key(initial, 0) for initial in initials], dtype=np.int64)
+        keys = initial_keys[initial_ids] | tokens["strongs"].to_numpy(dtype=np.int64)
+        phrase_ids, phrases = pd.factorize(tokens["phrase"])
+        occurrences = {
+            "book_id": tokens["book_id"].to_numpy(occurrence_dtypes["book_id"]),
+            "chapter": tokens["chapter"].to_numpy(occurrence_dtypes["chapter"]),
+            "verse": tokens["verse"].to_numpy(occurrence_dtypes["verse"]),
+            "word": tokens["word"].to_numpy(occurrence_dtypes["word"], na_value=0),
+            "phrase_id": phrase_ids.astype(occurrence_dtypes["phrase_id"]),
+        }
+        return keys, occurrences, list(phrases)
+
+if __name__ == '__main__':
+    input_excel = 'input/bsb_tables.xlsx'
+    excel_sheet = 'biblosinterlinear96'
+    header_row = 1
+    output_folder = 'output/'
+    ProcessConcordance(input_excel, excel_sheet, header_row, output_folder)
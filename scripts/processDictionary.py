@@ -1,36 +1,62 @@
 """Scripts to extract the Dcitionary data from the input XLSX/CSV file to an md format"""
 
-import pandas as pd
+from outputs import OutputSink
+from strongs import save_store
+from tokens import token_parts
 
 strong_col = 'Strongs'
 data_col = 'BDB / Thayers'
+sheet_columns = ['Verse', 'Heb Sort', 'Grk Sort', 'Language', strong_col, data_col]
+output_file = "Strongs_dictionary.md"
 
 class ProcessDictionary:
     def __init__(self,
-                 filepath, excel_sheet, header_row, output_folder="output"):
-        self.bsb_df = pd.read_excel(filepath, sheet_name=excel_sheet, header=header_row)
+                 filepath, excel_sheet, header_row, output_folder="output", bsb_df=None,
+                 streaming=False, verse_index=None, tokens=None, input_format=None):
+        '''The entries are taken from the token table of tokens.py, which can be passed in
+        if already built for the same rows, together with their verse_index.
+        When streaming, the table is built one book at a time'''
+        # Built from its columns only, the table is made without the English phrases it does not need
+        parts, _ = token_parts(filepath, excel_sheet, header_row, sheet_columns, bsb_df, streaming, verse_index, tokens,
+                               input_format)
+        writer = DictionaryWriter(output_folder)
+        for part in parts:
+            writer.write(part)
+        writer.close()
+        self.dictionary = writer.dictionary
 
+class DictionaryWriter:
+    '''Collects the entries of the token tables of consecutive parts of the sheet, like its books or
+    the chunks of a build, and saves the dictionary of all of them at close()'''
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
         self.dictionary = {}
-        self.bsb_df.apply(lambda row: self.row2dictionary(row), axis=1)
+
+    def write(self, tokens):
+        # The parts are in the order of the sheet, so the first definition of a number is in the first of them
+        for strong, definition in self.tokens2dictionary(tokens).items():
+            self.dictionary.setdefault(strong, definition)
+
+    def close(self):
         self.dictionary = dict(sorted(self.dictionary.items()))
-        self.save_output_file(output_folder)
-
-    def row2dictionary(self, row):
-    	try:
-    		if not pd.isna(row[strong_col]):
-    			strong_num = f"{row['Language'][0].upper()}{int(row[strong_col])}" 
-    			if strong_num not in self.dictionary:
-    				self.dictionary[strong_num] = row[data_col]
-    	except Exception as exce:
-    		print(f"Issue at {row=}")
-    		print(exce)
-
-    def save_output_file(self, output_folder):
-    	with open(f"{output_folder}/Strongs_dictionary.md", 'w', encoding='utf-8') as dict_file:
-    		dict_file.write("# Strongs Dictionary\n")
-    		for item in self.dictionary:
-    			dict_file.write(f"\n## {item}\n")
-    			dict_file.write(f"{self.dictionary[item]}\n")
+        sink = OutputSink()
+        self.save_output_file(self.output_folder, sink)
+        save_store(self.output_folder, self.dictionary, sink)
+        sink.close()
+
+    def tokens2dictionary(self, tokens):
+        '''First definition of each Strongs number in the order of the rows of the sheet, for all words at once'''
+        entries = tokens[tokens["strong"].notna()].sort_values("row", kind='stable') \
+            .drop_duplicates(subset="strong", keep='first')
+        return dict(zip(entries["strong"], entries["definition"]))
+
+    def save_output_file(self, output_folder, sink):
+    	sections = ["# Strongs Dictionary\n"]
+    	for item in self.dictionary:
+    		sections.append(f"\n## {item}\n")
+    		sections.append(f"{self.dictionary[item]}\n")
+    	sink.write(f"{output_folder}/{output_file}", "".join(sections))
 
 if __name__== '__main__':
     input_excel = 'input/bsb_tables.xlsx'
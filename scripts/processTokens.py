@@ -0,0 +1,23 @@
+'''Scripts to save the token table of the source words of the input XLSX/CSV file as Parquet'''
+
+from tokens import TokenWriter, sheet_columns, token_parts
+
+class ProcessTokens:
+    def __init__(self, filepath, excel_sheet, header_row, output_folder="output", bsb_df=None,
+                 streaming=False, verse_index=None, tokens=None, input_format=None):
+        '''tokens can be passed in if already built for the same rows, together with their verse_index.
+        When streaming, the table is built and written one book at a time'''
+        parts, _ = token_parts(filepath, excel_sheet, header_row, sheet_columns, bsb_df, streaming, verse_index, tokens,
+                               input_format)
+        writer = TokenWriter(output_folder)
+        for part in parts:
+            writer.write(part)
+        writer.close()
+        print(f"Saves {writer.count} tokens")
+
+if __name__ == '__main__':
+    input_excel = 'input/bsb_tables.xlsx'
+    excel_sheet = 'biblosinterlinear96'
+    header_row = 1
+    output_folder = 'output/'
+    ProcessTokens(input_excel, excel_sheet, header_row, output_folder)
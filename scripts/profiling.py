@@ -0,0 +1,119 @@
+'''Opt-in profiling of builds: wall time, rows per second, growth of the peak memory and per-book times of each phase.
+Enabled by build.py --profile, or by setting the BEREAN_PROFILE environment variable to the report path.
+The processors report books and file writes through the module functions, which do nothing when disabled'''
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+ENV_VAR = "BEREAN_PROFILE"
+DEFAULT_REPORT = "build_profile.json"
+
+def peak_rss_mb():
+    '''Peak resident memory of the process so far'''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives it in KB, macOS in bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+class Profiler:
+    def __init__(self, report_path=DEFAULT_REPORT):
+        self.report_path = report_path
+        self.started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.start_time = time.perf_counter()
+        self.phases = []
+        self.current = None
+        self.book_start = None
+
+    @contextmanager
+    def phase(self, name, rows=None):
+        start = time.perf_counter()
+        record = {"name": name, "rows": rows, "write_seconds": 0.0, "books": {}}
+        # The peak of the process never goes down, so a phase is measured by how much it raised it
+        start_peak = peak_rss_mb()
+        self.current, self.book_start = record, start
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            record["seconds"] = round(seconds, 3)
+            record["rows_per_sec"] = round(record["rows"] / seconds) if record["rows"] and seconds else None
+            record["write_seconds"] = round(record["write_seconds"], 3)
+            end_peak = peak_rss_mb()
+            record["peak_rss_growth_mb"] = round(end_peak - start_peak, 1) if end_peak is not None else None
+            self.phases.append(record)
+            self.current = None
+
+    def book_done(self, book):
+        '''Time since the previous book of the phase ended'''
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        books = self.current["books"]
+        books[book] = round(books.get(book, 0) + now - self.book_start, 4)
+        self.book_start = now
+
+    @contextmanager
+    def writing(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.current is not None:
+                self.current["write_seconds"] += time.perf_counter() - start
+
+    def report(self):
+        return {"started": self.started, "total_seconds": round(time.perf_counter() - self.start_time, 3),
+                "peak_rss_mb": peak_rss_mb(), "phases": self.phases}
+
+    def print_summary(self):
+        print(f"{'phase':<14} {'seconds':>9} {'writes':>8} {'rows/sec':>10} {'peak RSS +MB':>13} {'slowest book':>16}")
+        for record in self.phases:
+            slowest = max(record["books"].items(), key=lambda item: item[1], default=None)
+            growth = record["peak_rss_growth_mb"]
+            print(f"{record['name']:<14} {record['seconds']:>9} {record['write_seconds']:>8} "
+                  f"{record['rows_per_sec'] or '':>10} {'' if growth is None else growth:>13} "
+                  f"{f'{slowest[0]} {slowest[1]:.2f}' if slowest else '':>16}")
+
+    def save(self):
+        with open(self.report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.report(), report_file, indent=1)
+        print(f"Saved the profile to {self.report_path}")
+
+active = None
+
+def start(report_path=None):
+    '''Start profiling, with the report going to report_path, or the path in BEREAN_PROFILE'''
+    global active
+    active = Profiler(report_path or os.environ.get(ENV_VAR) or DEFAULT_REPORT)
+    return active
+
+def enabled_by_env():
+    return bool(os.environ.get(ENV_VAR))
+
+def finish():
+    '''Print the summary and save the report, if profiling'''
+    global active
+    if active is not None:
+        active.print_summary()
+        active.save()
+        active = None
+
+def phase(name, rows=None):
+    return active.phase(name, rows) if active is not None else nullcontext({})
+
+def book_done(book):
+    if active is not None:
+        active.book_done(book)
+
+def writing():
+    return active.writing() if active is not None else nullcontext()
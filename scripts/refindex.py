@@ -0,0 +1,97 @@
+'''Index of the verse references in the Verse column, shared by all processors'''
+
+import numpy as np
+import pandas as pd
+
+from utils import book_name_code_map
+
+ref_pattern = r'^(\d? ?[\w ]+) (\d+):(\d+)'
+
+# Book ids are the positions of the books in these lists
+book_names = list(book_name_code_map)
+book_codes = [book_name_code_map[name] for name in book_names]
+
+def parse_verse_refs(verses):
+    '''Split references like "1 John 3:16" into book id, chapter and verse arrays,
+    for the whole column at once'''
+    parts = verses.str.extract(ref_pattern)
+    if parts.isna().any(axis=None):
+        raise ValueError(f"Unrecognized verse references: {list(verses[parts[0].isna()])}")
+    books = pd.Categorical(parts[0], categories=book_names)
+    if (books.codes == -1).any():
+        raise KeyError(f"Unknown books: {sorted(set(parts[0][books.codes == -1]))}")
+    return (books.codes.astype(np.int8),
+            parts[1].astype(np.int16).to_numpy(),
+            parts[2].astype(np.int16).to_numpy())
+
+class VerseIndex:
+    '''The verses of the sheet, in the order they start in it, as compact arrays.
+    The i-th verse is verse[i] of chapter[i] of the book book_id[i], and the smallest
+    source word index (Grk Sort or Heb Sort) among its rows is start[i]'''
+
+    def __init__(self, verses, heb_sort, grk_sort):
+        verses = pd.Series(verses, dtype=object).reset_index(drop=True)
+        heb_sort = pd.Series(heb_sort, dtype=float).reset_index(drop=True)
+        grk_sort = pd.Series(grk_sort, dtype=float).reset_index(drop=True)
+
+        has_verse = verses.notna().to_numpy()
+        labels = verses[has_verse]
+        self.book_id, self.chapter, self.verse = parse_verse_refs(labels)
+
+        # Greek words have a Grk Sort, Hebrew ones a Heb Sort and a Grk Sort of 0.
+        # Rows without either continue with the index of the previous row.
+        src_index = grk_sort.where(grk_sort.notna() & (grk_sort != 0), heb_sort).ffill()
+        # Verse number of each row. Rows before the first verse get -1
+        self.row_verse = (np.cumsum(has_verse) - 1).astype(np.int32)
+        in_verse = self.row_verse >= 0
+        verse_min = src_index[in_verse].groupby(self.row_verse[in_verse]).min()
+        verse_min = verse_min.reindex(range(len(labels)), fill_value=-1).fillna(-1)
+        # A reference given again later in the sheet takes the start of its last occurrence
+        self.start = verse_min.groupby([self.book_id, self.chapter, self.verse]) \
+            .transform('last').to_numpy(np.int32)
+
+        self.labels = list(labels)
+        self.ordinal_of = {label: ordinal for ordinal, label in enumerate(self.labels)}
+
+    @classmethod
+    def from_frame(cls, bsb_df):
+        return cls(bsb_df['Verse'], bsb_df['Heb Sort'], bsb_df['Grk Sort'])
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''Build the index from streamed rows, keeping only the three columns it needs'''
+        verses, heb_sort, grk_sort = [], [], []
+        for row in rows:
+            verses.append(row['Verse'])
+            heb_sort.append(row['Heb Sort'])
+            grk_sort.append(row['Grk Sort'])
+        return cls(verses, heb_sort, grk_sort)
+
+    def subset(self, rows):
+        '''Index of the selected rows only, given as a positional slice or array in sheet order.
+        The selection has to start at a verse or at the first row, and take whole verses.
+        The verse starts are kept as computed over the whole sheet'''
+        row_verse = self.row_verse[rows]
+        ordinals = np.unique(row_verse[row_verse >= 0])
+        sub_index = object.__new__(VerseIndex)
+        sub_index.book_id = self.book_id[ordinals]
+        sub_index.chapter = self.chapter[ordinals]
+        sub_index.verse = self.verse[ordinals]
+        sub_index.start = self.start[ordinals]
+        sub_index.row_verse = np.where(row_verse >= 0, np.searchsorted(ordinals, row_verse), -1).astype(np.int32)
+        sub_index.labels = [self.labels[ordinal] for ordinal in ordinals]
+        sub_index.ordinal_of = {label: ordinal for ordinal, label in enumerate(sub_index.labels)}
+        return sub_index
+
+    def __len__(self):
+        return len(self.start)
+
+    def book_code(self, ordinal):
+        return book_codes[self.book_id[ordinal]]
+
+    def book_name(self, ordinal):
+        return book_names[self.book_id[ordinal]]
+
+    def ref(self, ordinal):
+        '''Reference in the form used in vref.txt, eg: GEN 1:1'''
+        return f"{self.book_code(ordinal)} {self.chapter[ordinal]}:{self.verse[ordinal]}"
@@ -0,0 +1,38 @@
+'''Columns of the interlinear sheet that each part of the build needs, and the compact dtypes
+they are loaded as'''
+
+import numpy as np
+import pandas as pd
+
+# Needed by VerseIndex, and so by every processor counting verses
+index_columns = ['Verse', 'Heb Sort', 'Grk Sort']
+
+# Whole numbers, with gaps. Stored as 4 bytes instead of float64
+int_columns = ['Heb Sort', 'Grk Sort', 'Strongs']
+# Few distinct values repeated over the rows. Stored as codes into the distinct values
+category_columns = ['Verse', 'Language', 'Parsing']
+
+def columns_for(*column_lists):
+    '''Union of the column lists, in the order they are first named'''
+    return list(dict.fromkeys(col for columns in column_lists for col in columns))
+
+def compact_int(values):
+    '''The column as nullable Int32, if all its values are whole numbers that fit in it'''
+    numbers = pd.to_numeric(values, errors='coerce')
+    present = numbers.dropna()
+    if numbers.isna().sum() != values.isna().sum() or not (present == np.trunc(present)).all() \
+            or (len(present) and (present.min() < np.iinfo(np.int32).min or present.max() > np.iinfo(np.int32).max)):
+        return values
+    return numbers.astype('Int32')
+
+def apply_schema(bsb_df):
+    '''Convert the columns present in the frame to their compact dtypes. Columns with
+    values that do not fit the dtype, like text in a number column, are kept as they are'''
+    bsb_df = bsb_df.copy()
+    for col in int_columns:
+        if col in bsb_df.columns:
+            bsb_df[col] = compact_int(bsb_df[col])
+    for col in category_columns:
+        if col in bsb_df.columns and bsb_df[col].dtype == object:
+            bsb_df[col] = bsb_df[col].astype('category')
+    return bsb_df
@@ -0,0 +1,76 @@
+'''Selecting the rows of some books or verse ranges, to generate the outputs for only a part of the sheet'''
+
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from refindex import book_codes
+
+# Inclusive range of verses of one book. Chapters or verses given as None are open ended
+VerseRange = namedtuple("VerseRange", ["book", "start_chapter", "start_verse", "end_chapter", "end_verse"])
+
+range_pattern = re.compile(r'^\s*(\w{3})(?:\s+(\d+)(?::(\d+))?(?:\s*-\s*(\d+)(?::(\d+))?)?)?\s*$')
+
+def parse_range(text):
+    '''Parse references like ROM, ROM 8, ROM 8-9, ROM 8:1-39, ROM 8:28 or ROM 8:1-9:5'''
+    match = range_pattern.match(text)
+    if match is None:
+        raise ValueError(f"Unrecognized range {text!r}. Expected eg: ROM 8:1-39")
+    book, start_chapter, start_verse, end_first, end_second = match.groups()
+    book = book.upper()
+    if book not in book_codes:
+        raise ValueError(f"Unknown book code {book!r} in range {text!r}")
+    to_int = lambda value: int(value) if value is not None else None
+    start_chapter, start_verse = to_int(start_chapter), to_int(start_verse)
+    if end_first is None:
+        # A single chapter, or a single verse
+        return VerseRange(book, start_chapter, start_verse, start_chapter, start_verse)
+    if end_second is not None:
+        return VerseRange(book, start_chapter, start_verse, int(end_first), int(end_second))
+    if start_verse is not None:
+        # ROM 8:1-39 ends in the same chapter
+        return VerseRange(book, start_chapter, start_verse, start_chapter, int(end_first))
+    return VerseRange(book, start_chapter, None, int(end_first), None)
+
+class RowIndex:
+    '''Rows of each verse of the sheet, built once from the verse index and then used to look up
+    the rows of any books or ranges. Verses are taken whole, from their first row to the first
+    row of the next verse, so processing the selected rows gives the same output as for
+    those verses in a build of the whole sheet'''
+
+    def __init__(self, verse_index):
+        self.verse_index = verse_index
+        verse_count = len(verse_index)
+        row_verse = verse_index.row_verse
+        self.first_row = np.searchsorted(row_verse, np.arange(verse_count + 1)).astype(np.int64)
+        # Rows before the first verse go with it, as they do in a build of the whole sheet
+        if verse_count:
+            self.first_row[0] = 0
+        self.first_row[verse_count] = len(row_verse)
+        self.verse_key = verse_index.chapter.astype(np.int64) * 1000 + verse_index.verse
+
+    def range_mask(self, verse_range):
+        '''Which verses of the index fall in the range'''
+        mask = self.verse_index.book_id == book_codes.index(verse_range.book)
+        if verse_range.start_chapter is not None:
+            mask &= self.verse_key >= verse_range.start_chapter * 1000 + (verse_range.start_verse or 0)
+        if verse_range.end_chapter is not None:
+            mask &= self.verse_key <= verse_range.end_chapter * 1000 + (verse_range.end_verse or 999)
+        return mask
+
+    def rows(self, books=(), ranges=()):
+        '''Positions of the rows of the given book codes and VerseRanges, in sheet order'''
+        selected = np.zeros(len(self.verse_index), dtype=bool)
+        for book in books:
+            selected |= self.range_mask(VerseRange(book.upper(), None, None, None, None))
+        for verse_range in ranges:
+            selected |= self.range_mask(verse_range)
+        ordinals = np.flatnonzero(selected)
+        if len(ordinals) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts, stops = self.first_row[ordinals], self.first_row[ordinals + 1]
+        lengths = stops - starts
+        # Position of each row: the start of its verse, plus its offset in the verse
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + offsets
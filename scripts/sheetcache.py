@@ -0,0 +1,82 @@
+'''On-disk columnar cache of the parsed input sheet, to avoid re-parsing the XLSX file on every run'''
+
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+CACHE_FOLDER = ".cache/sheets"
+MAX_AGE_DAYS = 30
+MAX_ENTRIES = 4
+
+def file_digest(filepath, chunk_size=1 << 20):
+    '''sha256 of the file contents'''
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as in_file:
+        for chunk in iter(lambda: in_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(filepath, excel_sheet, header_row):
+    '''Key of a cache entry: the workbook contents, the sheet and the header row used to read it'''
+    key = hashlib.sha256()
+    key.update(file_digest(filepath).encode())
+    key.update(f"\0{excel_sheet}\0{header_row}".encode())
+    return key.hexdigest()
+
+def _arrow_compatible(sheet_df):
+    '''Arrow needs one type per column. Cells of a different type in a text column are stored as text'''
+    sheet_df = sheet_df.copy()
+    for col in sheet_df.columns:
+        if sheet_df[col].dtype == object and \
+                pd.api.types.infer_dtype(sheet_df[col], skipna=True) not in ("string", "empty"):
+            not_null = sheet_df[col].notna()
+            sheet_df.loc[not_null, col] = sheet_df.loc[not_null, col].astype(str)
+    return sheet_df
+
+def restore_missing(sheet_df):
+    '''Arrow gives None for missing text cells, where read_excel gives NaN'''
+    for col in sheet_df.columns:
+        if sheet_df[col].dtype == object:
+            values = sheet_df[col].to_numpy(copy=True)
+            values[pd.isna(values)] = np.nan
+            sheet_df[col] = values
+    return sheet_df
+
+def evict(cache_folder=CACHE_FOLDER, max_age_days=MAX_AGE_DAYS, max_entries=MAX_ENTRIES):
+    '''Remove entries not used for max_age_days, and then the least recently used ones beyond max_entries'''
+    if not os.path.isdir(cache_folder):
+        return
+    entries = [os.path.join(cache_folder, name)
+               for name in os.listdir(cache_folder) if name.endswith(".feather")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    oldest_allowed = time.time() - max_age_days * 24 * 60 * 60
+    for index, path in enumerate(entries):
+        if index >= max_entries or os.path.getmtime(path) < oldest_allowed:
+            os.remove(path)
+
+def load_cached(filepath, excel_sheet, header_row, read_sheet,
+                cache_folder=CACHE_FOLDER, refresh=False,
+                max_age_days=MAX_AGE_DAYS, max_entries=MAX_ENTRIES, columns=None):
+    '''Return the sheet from the cache if present, else read it with read_sheet() and cache it.
+    refresh=True ignores any existing entry and rebuilds it.
+    With a list of columns only those are returned, and only those are read from a cache entry'''
+    cache_path = os.path.join(cache_folder, f"{cache_key(filepath, excel_sheet, header_row)}.feather")
+    if not refresh and os.path.exists(cache_path):
+        os.utime(cache_path)
+        return restore_missing(feather.read_table(cache_path, columns=columns, memory_map=True).to_pandas())
+
+    sheet_df = read_sheet()
+    if not all(isinstance(col, str) for col in sheet_df.columns):
+        print(f"Not caching {filepath}: the header row has non-text column names")
+        return sheet_df if columns is None else sheet_df[columns]
+    sheet_df = _arrow_compatible(sheet_df)
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    sheet_df.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, cache_path)
+    evict(cache_folder, max_age_days, max_entries)
+    return sheet_df if columns is None else sheet_df[columns]
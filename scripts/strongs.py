@@ -0,0 +1,56 @@
+'''Indexed store of the Strongs dictionary, to look up one entry without reading the whole markdown file'''
+
+import os
+import sqlite3
+
+store_file = "Strongs_dictionary.sqlite"
+
+def save_store(output_folder, dictionary, sink):
+    '''Write the entries of the dictionary, keyed like H430 or G2316, to an SQLite file.
+    It is built in a scratch file first, and handed to the OutputSink to replace the old one'''
+    path = os.path.join(output_folder, store_file)
+    temp_path = f"{path}.build"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    with sqlite3.connect(temp_path) as connection:
+        connection.execute("CREATE TABLE dictionary (strong TEXT PRIMARY KEY, entry TEXT) WITHOUT ROWID")
+        connection.executemany("INSERT INTO dictionary VALUES (?, ?)",
+                               ((strong, str(entry)) for strong, entry in dictionary.items()))
+    connection.close()
+    with open(temp_path, 'rb') as store:
+        sink.write(path, store.read())
+    os.remove(temp_path)
+
+class StrongsDictionary:
+    '''Lookups into the store written by save_store(). Each lookup reads only the one entry'''
+
+    def __init__(self, output_folder="output"):
+        path = os.path.join(output_folder, store_file)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    @staticmethod
+    def normalize(strong):
+        '''Accepts the numbers as in the link-href of the USFM files too, eg: h430'''
+        return strong.strip().lstrip("#").upper()
+
+    def get(self, strong, default=None):
+        row = self.connection.execute(
+            "SELECT entry FROM dictionary WHERE strong = ?", (self.normalize(strong),)).fetchone()
+        return default if row is None else row[0]
+
+    def __getitem__(self, strong):
+        entry = self.get(strong)
+        if entry is None:
+            raise KeyError(strong)
+        return entry
+
+    def __contains__(self, strong):
+        return self.get(strong) is not None
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM dictionary").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
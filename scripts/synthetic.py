@@ -0,0 +1,122 @@
+'''Synthetic sheets shaped like biblosinterlinear96, for measuring the processors without the real input.
+At scale 1 the sheet has about as many verses and rows as the real one'''
+
+import argparse
+import random
+
+import numpy as np
+import pandas as pd
+
+from processAlignment import target_col
+
+columns = ['Heb Sort', 'Grk Sort', 'BSB Sort', 'Verse', 'Language', target_col, 'Translit', 'Parsing',
+           'Strongs', 'Vs', 'Heading', 'Cross References', 'BSB Version', 'Footnotes', 'BDB / Thayers']
+
+old_testament = ["Genesis", "Exodus", "Leviticus", "Numbers", "Deuteronomy", "Joshua", "Judges", "Ruth",
+                 "1 Samuel", "2 Samuel", "1 Kings", "2 Kings", "1 Chronicles", "2 Chronicles", "Ezra",
+                 "Nehemiah", "Esther", "Job", "Psalm", "Proverbs", "Ecclesiastes", "Song of Solomon",
+                 "Isaiah", "Jeremiah", "Lamentations", "Ezekiel", "Daniel", "Hosea", "Joel", "Amos",
+                 "Obadiah", "Jonah", "Micah", "Nahum", "Habakkuk", "Zephaniah", "Haggai", "Zechariah",
+                 "Malachi"]
+new_testament = ["Matthew", "Mark", "Luke", "John", "Acts", "Romans", "1 Corinthians", "2 Corinthians",
+                 "Galatians", "Ephesians", "Philippians", "Colossians", "1 Thessalonians", "2 Thessalonians",
+                 "1 Timothy", "2 Timothy", "Titus", "Philemon", "Hebrews", "James", "1 Peter", "2 Peter",
+                 "1 John", "2 John", "3 John", "Jude", "Revelation"]
+
+# 66 books of 18 chapters of 26 verses, with 8 to 20 words each, is close to the real sheet
+CHAPTERS_PER_BOOK = 18
+VERSES_PER_CHAPTER = 26
+WORDS_PER_VERSE = (8, 20)
+EXCEL_MAX_ROWS = 1048576
+
+english_words = ["the", "and", "of", "God", "LORD", "said", "to", "in", "was", "he", "land", "people",
+                 "heaven", "earth", "king", "his", "sons", "Israel", "upon", "all"]
+# BSB Version cells with the special notations, and how often they occur
+notation_cells = [("[is]", 0.03), ("[the] {one}", 0.005), ("{to them}", 0.01), ("the [ones] who", 0.01),
+                  ("- ", 0.03), ("-", 0.01), (". . .", 0.01), ("vvv", 0.01)]
+
+def bsb_cell(rnd):
+    '''A BSB Version cell. The notations occur at their rate on any word of a verse, also on its first
+    and last words, where . . . and vvv have no English words of the verse to go with'''
+    draw = rnd.random()
+    for cell, share in notation_cells:
+        if draw < share:
+            return cell
+        draw -= share
+    return " ".join(rnd.choice(english_words) for _ in range(rnd.choice((1, 1, 1, 2, 3))))
+
+def make_frame(scale=1.0, seed=7):
+    '''A frame like read_excel gives for the sheet, with the words of each verse in English order
+    and their Heb Sort or Grk Sort shuffled, as in the real sheet'''
+    rnd = random.Random(seed)
+    chapters = max(1, round(CHAPTERS_PER_BOOK * scale))
+    data = {col: [] for col in columns}
+    src_index = {"OT": 0, "NT": 0}
+    for testament, books in (("OT", old_testament), ("NT", new_testament)):
+        for book in books:
+            for chapter in range(1, chapters + 1):
+                for verse in range(1, VERSES_PER_CHAPTER + 1):
+                    count = rnd.randint(*WORDS_PER_VERSE)
+                    first = src_index[testament] + 1
+                    src_index[testament] += count
+                    order = list(range(first, first + count))
+                    rnd.shuffle(order)
+                    for position, src in enumerate(order):
+                        if testament == "OT":
+                            language = "Aramaic" if book == "Daniel" and chapter in (2, 3) else "Hebrew"
+                            strongs = rnd.randint(1, 8674)
+                            data['Heb Sort'].append(src)
+                            data['Grk Sort'].append(0)
+                            data[target_col].append(f"ה{src % 997}א")
+                            data['Parsing'].append(rnd.choice(["HNcmpa", "HVqp3ms", "HR/Ncfsa", "HC/Vqw3ms"]))
+                        else:
+                            language = "Greek"
+                            strongs = rnd.randint(1, 5624)
+                            data['Heb Sort'].append(999999)
+                            data['Grk Sort'].append(src)
+                            data[target_col].append(f"λόγος{src % 997}")
+                            data['Parsing'].append(rnd.choice(["N-NMS", "V-AIA-3S", "Art-GMS", "Conj"]))
+                        verse_start = position == 0
+                        data['BSB Sort'].append(len(data['BSB Sort']) + 1)
+                        data['Verse'].append(f"{book} {chapter}:{verse}" if verse_start else np.nan)
+                        data['Vs'].append(verse if verse_start else np.nan)
+                        data['Language'].append(language)
+                        data['Translit'].append(f"translit{src % 101}")
+                        data['Strongs'].append(strongs if rnd.random() < 0.97 else np.nan)
+                        data['Heading'].append(f"Section <i>{book}</i> {chapter}"
+                                               if verse_start and verse % 9 == 1 else np.nan)
+                        data['Cross References'].append("(John 1:1–5; Hebrews 11:1–3)"
+                                                        if verse_start and rnd.random() < 0.3 else np.nan)
+                        data['BSB Version'].append(bsb_cell(rnd) if rnd.random() < 0.97 else np.nan)
+                        data['Footnotes'].append(
+                            f"Or <i>heaven</i>; see <span class=|fnv|>{verse}</span> and elsewhere"
+                            if rnd.random() < 0.01 else np.nan)
+                        data['BDB / Thayers'].append(f"Definition of {language[0]}{strongs}")
+    bsb_df = pd.DataFrame(data, columns=columns)
+    for col in ['Heb Sort', 'Grk Sort', 'BSB Sort', 'Vs', 'Strongs']:
+        bsb_df[col] = bsb_df[col].astype(float)
+    return bsb_df
+
+def write_workbook(path, scale=1.0, seed=7, excel_sheet="biblosinterlinear96"):
+    '''Write the synthetic sheet as an XLSX file, with a title row above the header like the real one'''
+    bsb_df = make_frame(scale, seed)
+    if len(bsb_df) + 2 > EXCEL_MAX_ROWS:
+        raise ValueError(f"{len(bsb_df)} rows do not fit in an XLSX sheet. Use make_frame() for this scale")
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame([["Berean Interlinear Bible"]]).to_excel(
+            writer, sheet_name=excel_sheet, header=False, index=False)
+        bsb_df.to_excel(writer, sheet_name=excel_sheet, startrow=1, index=False)
+    return len(bsb_df)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic input XLSX file")
+    parser.add_argument("--output", default="input/synthetic_bsb_tables.xlsx")
+    parser.add_argument("--scale", type=float, default=0.1,
+                        help="Size relative to the real sheet, eg: 0.1 or 1")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    row_count = write_workbook(args.output, args.scale, args.seed)
+    print(f"Wrote {row_count} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
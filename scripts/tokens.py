@@ -0,0 +1,204 @@
+'''Token table of the source words of the sheet: one typed row per Hebrew, Aramaic or Greek word,
+with its verse, word number, Strongs number and English phrase worked out once, sorted in the
+source word order of each testament. The Hebrew and Greek USFM files, the concordance and the
+Strongs dictionary are rendered from it, and it is saved as Parquet for other tools to read.
+The BSB USFM files and the alignment follow the English rows of the sheet, with the headings,
+footnotes and notations of their cells, so they are still rendered from the rows'''
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as parquet
+
+import notation
+from loader import iter_bsb_rows, iter_book_slices, load_bsb_sheet, rows_frame
+from outputs import replace_if_changed
+from refindex import VerseIndex
+
+target_col = 'WLC / Nestle Base {TR} ⧼RP⧽ (WH) 〈NE〉 [NA] ‹SBL› [[ECM]]'
+# Sheet columns the table is built from. Only Verse, Language, Heb Sort and Grk Sort are required,
+# the table has the columns of the others that are loaded
+sheet_columns = ['Verse', 'Language', 'Heb Sort', 'Grk Sort', target_col, 'Strongs', 'Parsing', 'Translit',
+                 'BSB Version', 'BDB / Thayers']
+# Table columns taken as they are from the sheet
+copied_columns = {target_col: "text", 'Parsing': "parsing", 'Translit': "translit", 'BSB Version': "bsb",
+                  'BDB / Thayers': "definition"}
+
+testaments = {"OT": ["Hebrew", "Aramaic"], "NT": ["Greek"]}
+# Categories of the language column, the same in every part of the sheet
+languages = sorted(language for names in testaments.values() for language in names)
+tokens_folder = "tokens"
+output_files = [f"{tokens_folder}/tokens_{testament.lower()}.parquet" for testament in testaments]
+
+def english_phrase(cell_text):
+    '''The English words of a BSB Version cell, with the added words in [], and without the {} enclosed
+    text and the alignment notations, which are not a rendering of the source word'''
+    parts = []
+    for kind, text in notation.tokenize(cell_text):
+        if kind in (notation.WORD, notation.TEXT):
+            parts.append(text)
+        elif kind == notation.ADD:
+            parts.append(f"[{text}]")
+    return " ".join(" ".join(parts).split())
+
+def token_table(bsb_df, verse_index):
+    '''The table of the source words in the rows of the frame. The verse of each row is found by its
+    label in the verse index, so the frame can be any selection of whole verses of the indexed sheet,
+    with the Verse given on the first row of each verse or on all of them.
+
+    Columns: row (label of the row in the frame, its position under the header of the sheet),
+    testament, language, book_id, chapter, verse, verse_ordinal, sort (Heb Sort or Grk Sort), word
+    (number of the word in the verse, as in the srcloc of the USFM files), strongs and strong (the
+    dictionary key, eg: H430), and text, parsing, translit, bsb, phrase (the English phrase of the
+    BSB Version cell) and definition (the BDB / Thayers cell) for the loaded columns'''
+    language = bsb_df['Language'].astype(object).to_numpy()
+    testament = np.full(len(language), None, dtype=object)
+    for name, languages in testaments.items():
+        testament[np.isin(language, languages)] = name
+    # Rows before the first verse are in no verse, and have no verse_ordinal
+    label_ids, labels = pd.factorize(bsb_df['Verse'].astype(object).ffill())
+    ordinal_of = verse_index.ordinal_of
+    label_ordinals = np.array([ordinal_of.get(label, -1) for label in labels], dtype=np.int32)
+    ordinals = np.where(label_ids >= 0, label_ordinals[label_ids], -1).astype(np.int32)
+    rows = np.flatnonzero((testament != None) & (ordinals >= 0))
+    ordinals = ordinals[rows]
+
+    table = pd.DataFrame({"row": bsb_df.index.to_numpy()[rows].astype(np.int32), "testament": testament[rows],
+                          "language": language[rows]})
+    table["book_id"] = verse_index.book_id[ordinals]
+    table["chapter"] = verse_index.chapter[ordinals]
+    table["verse"] = verse_index.verse[ordinals]
+    table["verse_ordinal"] = ordinals
+    heb_sort = bsb_df['Heb Sort'].to_numpy(dtype=float, na_value=np.nan)[rows]
+    grk_sort = bsb_df['Grk Sort'].to_numpy(dtype=float, na_value=np.nan)[rows]
+    sort = np.where(table["testament"] == "NT", grk_sort, heb_sort)
+    table["sort"] = pd.array(sort, dtype='Int32')
+    table["word"] = pd.array(sort - verse_index.start[ordinals] + 1, dtype='Int32')
+
+    if 'Strongs' in bsb_df.columns:
+        numbers = np.trunc(pd.to_numeric(bsb_df['Strongs'], errors='coerce').to_numpy(dtype=float, na_value=np.nan))
+        table["strongs"] = pd.array(numbers[rows], dtype='Int32')
+        # The dictionary keys numbers by the initial of the language
+        language_ids, languages = pd.factorize(table["language"])
+        initials = np.array([name[0].upper() for name in languages], dtype=object)[language_ids]
+        has_strong = ~np.isnan(numbers[rows])
+        strong = np.full(len(rows), None, dtype=object)
+        strong[has_strong] = initials[has_strong] + numbers[rows][has_strong].astype(np.int64).astype(str).astype(object)
+        table["strong"] = strong
+    for col, name in copied_columns.items():
+        if col in bsb_df.columns:
+            table[name] = bsb_df[col].astype(object).to_numpy()[rows]
+    if "bsb" in table.columns:
+        phrase_ids, cells = pd.factorize(table["bsb"])
+        phrases = np.array([english_phrase(str(cell)) for cell in cells] + [""], dtype=object)
+        # Words without a BSB Version cell get the empty phrase
+        table["phrase"] = phrases[phrase_ids]
+
+    return sort_table(table)
+
+def sort_table(table):
+    '''Sort the rows in the source word order of each testament. Rows of the same word stay in their order.
+    The tables of consecutive parts of the sheet, put together, sort to the table of the whole of them'''
+    table["testament"] = pd.Categorical(table["testament"], categories=list(testaments))
+    table["language"] = pd.Categorical(table["language"], categories=languages)
+    return table.sort_values(by=["testament", "sort"], kind='stable', na_position='last', ignore_index=True)
+
+def testament_tables(table):
+    '''The rows of the table of each testament'''
+    return {name: table[table["testament"] == name].reset_index(drop=True) for name in testaments}
+
+def iter_token_tables(filepath, excel_sheet, header_row, columns, verse_index=None, input_format=None):
+    '''Token tables of the books of the sheet, one at a time, from its rows streamed with the given columns.
+    Without a verse_index, the verses of the whole sheet are indexed in a first pass over the rows'''
+    sheet_rows = lambda: iter_bsb_rows(filepath, excel_sheet, header_row, columns, input_format)
+    if verse_index is None:
+        verse_index = VerseIndex.from_rows(sheet_rows())
+    for book_rows in iter_book_slices(sheet_rows()):
+        yield token_table(rows_frame(book_rows, columns), verse_index)
+
+def token_parts(filepath, excel_sheet, header_row, columns, bsb_df=None, streaming=False, verse_index=None,
+                tokens=None, input_format=None):
+    '''The token tables a processor rendering from tokens works on, with the verse index of their verse_ordinal:
+    the tokens passed in, if already built for the same rows together with their verse_index, or when streaming,
+    the tables of the books of the sheet, built one at a time. Otherwise the table of the frame, loaded if
+    not passed in, from the file in input_format. The tables are built from the given columns, the ones the
+    processor needs'''
+    if tokens is not None:
+        return [tokens], verse_index
+    if streaming:
+        if verse_index is None:
+            verse_index = VerseIndex.from_rows(iter_bsb_rows(filepath, excel_sheet, header_row, columns, input_format))
+        return iter_token_tables(filepath, excel_sheet, header_row, columns, verse_index, input_format), verse_index
+    if bsb_df is None:
+        bsb_df = load_bsb_sheet(filepath, excel_sheet, header_row, columns=columns, input_format=input_format)
+    if verse_index is None:
+        verse_index = VerseIndex.from_frame(bsb_df)
+    # Without the other columns of the frame, the table has none of the columns the processor does not need
+    return [token_table(bsb_df[[col for col in columns if col in bsb_df.columns]], verse_index)], verse_index
+
+def arrow_schema(table):
+    '''Parquet schema of the table. Columns without any value in it are typed as the text they have elsewhere'''
+    schema = pa.Schema.from_pandas(table, preserve_index=False)
+    for index, field in enumerate(schema):
+        if field.type == pa.null():
+            schema = schema.set(index, field.with_type(pa.string()))
+    return schema
+
+class TokenWriter:
+    '''Writes the token tables of consecutive parts of the sheet, like its books, to the Parquet files as
+    they are made, one row group per part, so that the table of the whole sheet is never held in memory.
+    The parts have to follow each other in the source word order of each testament, as the books do in
+    the sheet. The files then have the same table as the one of the whole sheet'''
+
+    def __init__(self, output_folder):
+        os.makedirs(os.path.join(output_folder, tokens_folder), exist_ok=True)
+        self.paths = {name: os.path.join(output_folder, path) for name, path in zip(testaments, output_files)}
+        self.writers = {}
+        self.schema = None
+        self.last_sort = {}
+        # Words without a Heb Sort or Grk Sort go after all others of their testament
+        self.unsorted = {name: [] for name in testaments}
+        self.columns = None
+        self.count = 0
+
+    def write(self, table):
+        self.columns = table.iloc[:0]
+        self.count += len(table)
+        for name, rows in testament_tables(table).items():
+            has_sort = rows["sort"].notna().to_numpy()
+            self.unsorted[name].append(rows[~has_sort])
+            rows = rows[has_sort]
+            if len(rows) == 0:
+                continue
+            if rows["sort"].iloc[0] < self.last_sort.get(name, rows["sort"].iloc[0]):
+                raise ValueError(f"The {name} words of the parts of the sheet are not in their source word order, "
+                                 "so the token table cannot be written one part at a time")
+            self.last_sort[name] = rows["sort"].iloc[-1]
+            self.write_rows(name, rows)
+
+    def write_rows(self, name, rows):
+        if self.schema is None:
+            self.schema = arrow_schema(rows)
+        if name not in self.writers:
+            self.writers[name] = parquet.ParquetWriter(f"{self.paths[name]}.tmp", self.schema)
+        self.writers[name].write_table(pa.Table.from_pandas(rows.reset_index(drop=True), schema=self.schema,
+                                                            preserve_index=False))
+
+    def close(self):
+        for name in testaments:
+            unsorted = [rows for rows in self.unsorted[name] if len(rows)]
+            if unsorted:
+                self.write_rows(name, pd.concat(unsorted, ignore_index=True))
+            if name not in self.writers and self.columns is not None:
+                # A testament without words still gets its file, with no rows
+                self.write_rows(name, testament_tables(self.columns)[name])
+        for name, writer in self.writers.items():
+            writer.close()
+            replace_if_changed(f"{self.paths[name]}.tmp", self.paths[name])
+
+def load_tokens(output_folder="output", columns=None):
+    '''The table saved by a TokenWriter, with the given columns or all of them'''
+    return pd.concat([parquet.read_table(os.path.join(output_folder, path), columns=columns).to_pandas()
+                      for path in output_files], ignore_index=True)
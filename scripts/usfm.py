@@ -0,0 +1,177 @@
+'''Writer for USFM files, shared by the processors generating them'''
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from outputs import replace_if_changed
+from tokens import token_parts
+
+def attribute(name, value, end=" "):
+    '''A \\w attribute like: strong="3972" '''
+    return f'{name}="{value}"{end}'
+
+def as_text(values):
+    '''Values of a column as an object array of strings, formatted like in an f-string'''
+    return pd.Series(values, dtype=object).astype(str).to_numpy(dtype=object)
+
+def w_markers(words, strongs, languages, parsing, translit, morph_separator="|"):
+    '''The \\w marker of each source word, with its strong, link-href, x-morph and x-translit
+    attributes, built for whole columns at once. Rows without a word get "".
+    The | separators in the morph codes are replaced with morph_separator'''
+    words, languages = words.to_numpy(dtype=object), languages.to_numpy(dtype=object)
+    parsing, translit = parsing.to_numpy(dtype=object), translit.to_numpy(dtype=object)
+    attributes = np.full(len(words), "", dtype=object)
+
+    numbers = np.trunc(pd.to_numeric(strongs, errors='coerce').to_numpy(dtype=float, na_value=np.nan))
+    has_strong = ~np.isnan(numbers)
+    strong_text = as_text(numbers[has_strong].astype(np.int64))
+    initials = pd.Series(languages[has_strong], dtype=object).str[0].str.lower().to_numpy(dtype=object)
+    attributes[has_strong] = ('strong="' + strong_text + '" link-href="./Strongs_dictionary.md#'
+                              + initials + strong_text + '" ')
+
+    has_parsing = pd.notna(parsing)
+    morph = as_text(parsing[has_parsing])
+    if morph_separator != "|":
+        morph = pd.Series(morph, dtype=object).str.replace("|", morph_separator, regex=False).to_numpy(dtype=object)
+    attributes[has_parsing] += 'x-morph="' + morph + '" '
+
+    has_translit = pd.notna(translit)
+    attributes[has_translit] += 'x-translit="' + as_text(translit[has_translit]) + '"'
+
+    markers = np.full(len(words), "", dtype=object)
+    has_word = pd.notna(words)
+    markers[has_word] = "\\w " + as_text(words[has_word]) + " |" + attributes[has_word] + "\\w*"
+    return markers
+
+class UsfmWriter:
+    '''Builds the USFM of a book from fragments kept in a list, instead of growing one string.
+    Each completed chapter is written out to a temporary file of the book, so only one chapter is held in memory.
+    When the book is done, the temporary file replaces the book's file, unless that already has the same content'''
+
+    def __init__(self):
+        self.fragments = []
+        self.out_file = None
+        self.path = None
+        self.first_chapter = True
+
+    def start_book(self, path, book_code, description):
+        '''Open the temporary file of a new book and write its \\id line. The previous book should be closed'''
+        self.path = path
+        self.out_file = open(f"{path}.tmp", 'w', encoding='utf-8', newline='')
+        self.fragments = [f"\\id {book_code} {description}\n"]
+        self.first_chapter = True
+
+    def flush(self):
+        '''Write out the fragments built so far'''
+        if self.out_file is not None and self.fragments:
+            with profiling.writing():
+                self.out_file.write("".join(self.fragments))
+        self.fragments = []
+
+    def close(self):
+        '''Finish the current book. Returns True if there was a book open'''
+        if self.out_file is None:
+            return False
+        self.flush()
+        with profiling.writing():
+            self.out_file.close()
+            replace_if_changed(f"{self.path}.tmp", self.path)
+        self.out_file = None
+        self.path = None
+        return True
+
+    def text(self, text):
+        self.fragments.append(text)
+
+    def chapter(self, number):
+        if self.first_chapter:
+            self.first_chapter = False
+            self.fragments.append(f"\\c {number}\n\\p\n")
+        else:
+            self.flush()
+            self.fragments.append(f"\n\\c {number}\n\\p\n")
+
+    def verse(self, number):
+        self.fragments.append(f"\\v {number} ")
+
+    def heading(self, text):
+        self.fragments.append(f"\n\\s {text}\n\\p\n")
+
+    def w(self, text, attributes="", end=" "):
+        '''A \\w marker around text, with attributes formed using attribute()'''
+        self.fragments.append(f"\\w {text} |{attributes}\\w*{end}")
+
+    def add(self, text):
+        self.fragments.append(f"\\add {text}\\add* ")
+
+    def footnote(self, ref, text):
+        self.fragments.append(f"\\f + \\fr {ref} \\ft {text} \\f* ")
+
+    def cross_ref(self, origin, items):
+        self.fragments.append(f"\\x + \\xo {origin}: \\xt {items} \\x* ")
+
+class SourceWordsUsfm:
+    '''Writes the USFM files of the words of one language of the token table of tokens.py, one file per book.
+    Subclasses give the language, the file of each book, the title of the books and the separator of the
+    morph codes. The token table can be passed in if already built for the same rows, together with their
+    verse_index. When streaming, only one book is held in memory at a time. The file is read in input_format,
+    or the format of its extension'''
+    language = None
+    book_file = None
+    title = None
+    morph_separator = "|"
+
+    def __init__(self, filepath, excel_sheet, header_row, output_folder, columns, bsb_df=None,
+                 streaming=False, verse_index=None, tokens=None, input_format=None):
+        self.output_folder = output_folder
+        self.current_book = ""
+        self.current_chapter = ""
+        self.current_verse = ""
+        self.usfm = UsfmWriter()
+        self.current_ref = ""
+        parts, self.verse_index = token_parts(filepath, excel_sheet, header_row, columns, bsb_df, streaming,
+                                              verse_index, tokens, input_format)
+        for part in parts:
+            self.frame2usfm(self.words(part))
+        self.save_one_book()
+
+    def words(self, tokens):
+        '''The words of the language in the token table, which is in their source order'''
+        return tokens[tokens["language"] == self.language]
+
+    def frame2usfm(self, words_df):
+        '''Write the words of the token table, in their source order. The \\w markers are built for
+        all words at once, and the book, chapter and verse markers go in where the verse changes'''
+        markers = w_markers(words_df["text"], words_df["strongs"], words_df["language"],
+                            words_df["parsing"], words_df["translit"], morph_separator=self.morph_separator)
+        ordinals = words_df["verse_ordinal"].to_numpy()
+        verse_starts = np.flatnonzero(np.diff(ordinals, prepend=-1) != 0)
+        bounds = [*verse_starts.tolist(), len(ordinals)]
+        for start, stop, ordinal in zip(bounds[:-1], bounds[1:], ordinals[verse_starts]):
+            self.usfm.verse(self.process_verse(ordinal))
+            self.usfm.text("".join(markers[start:stop]))
+
+    def process_verse(self, ordinal):
+        ref_book = self.verse_index.book_name(ordinal)
+        ref_chapter = str(self.verse_index.chapter[ordinal])
+        ref_verse = str(self.verse_index.verse[ordinal])
+        book_code = self.verse_index.book_code(ordinal)
+        if book_code != self.current_book:
+            self.save_one_book()
+            self.current_book = book_code
+            self.current_chapter = ref_chapter
+            self.usfm.start_book(f'{self.output_folder}/{self.book_file.format(book_code)}', book_code,
+                                 f"{ref_book} of {self.title}")
+            self.usfm.chapter(ref_chapter)
+        elif ref_chapter != self.current_chapter:
+            self.usfm.chapter(ref_chapter)
+            self.current_chapter = ref_chapter
+        self.current_verse = ref_verse
+        self.current_ref = self.verse_index.labels[ordinal]
+        return ref_verse
+
+    def save_one_book(self):
+        if self.usfm.close():
+            print(f"Saves {self.current_book}")
+            profiling.book_done(self.current_book)
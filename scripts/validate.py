@@ -0,0 +1,140 @@
+'''Consistency checks of the generated alignment outputs, done on NumPy arrays of the whole
+files at once so that they are quick enough to run after every build'''
+
+import argparse
+import glob
+import os
+import re
+
+import numpy as np
+
+from corpus import book_ids
+from processAlignment import output_files
+
+bsb_text_file, heb_grk_text_file, alignment_file, vref_file = output_files
+
+# Problems reported of each kind, at most. The rest are only counted
+MAX_REPORTS = 10
+
+pair_pattern = re.compile(r'^(\d+-\d+( \d+-\d+)*)?$')
+vref_pattern = re.compile(r'^(\w+) (\d+):(\d+)$')
+srcloc_pattern = re.compile(r'srcloc="\w+:(\w+)\.(\d+)\.(\d+)\.(-?\d+)"')
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as in_file:
+        return in_file.read().split("\n")
+
+def word_counts(lines):
+    '''Number of words of each line, separated by single spaces as in the output files'''
+    return np.fromiter((line.count(" ") + 1 if line else 0 for line in lines), dtype=np.int64, count=len(lines))
+
+def verse_keys(books, chapters, verses):
+    '''Integer keys of the references, as corpus.vref_key() gives them. Unknown books get -1'''
+    codes, inverse = np.unique(np.asarray(books), return_inverse=True)
+    ids = np.array([book_ids.get(code, -1) for code in codes], dtype=np.int64)[inverse]
+    keys = (ids << 20) | (np.asarray(chapters, dtype=np.int64) << 10) | np.asarray(verses, dtype=np.int64)
+    return np.where(ids < 0, -1, keys)
+
+def report(problems, items, describe):
+    '''Add the problem described for each of the items, up to MAX_REPORTS of them'''
+    for item in items[:MAX_REPORTS]:
+        problems.append(describe(item))
+    if len(items) > MAX_REPORTS:
+        problems.append(f"... and {len(items) - MAX_REPORTS} more like it")
+
+def parse_pairs(alignment):
+    '''Pharaoh pairs of all lines as (bsb, heb_grk) rows, and the line of each pair.
+    Malformed lines are returned separately, and have no pairs'''
+    malformed = [number for number, line in enumerate(alignment) if not pair_pattern.match(line)]
+    if malformed:
+        alignment = list(alignment)
+        for number in malformed:
+            alignment[number] = ""
+    counts = np.fromiter((line.count("-") for line in alignment), dtype=np.int64, count=len(alignment))
+    pairs = np.array(" ".join(alignment).replace("-", " ").split(), dtype=np.int64).reshape(-1, 2)
+    return pairs, np.repeat(np.arange(len(alignment)), counts), malformed
+
+def check_alignment(output_folder, problems):
+    '''Line counts of the four files, and the bounds of the pairs. Returns the references
+    and the word counts of the Hebrew and Greek lines, for check_srclocs()'''
+    lines = {}
+    for file_name in output_files:
+        path = os.path.join(output_folder, file_name)
+        if not os.path.exists(path):
+            problems.append(f"{path} is missing")
+            return None
+        lines[file_name] = read_lines(path)
+    vrefs = lines[vref_file]
+    for file_name in output_files[:3]:
+        if len(lines[file_name]) != len(vrefs):
+            problems.append(f"{file_name} has {len(lines[file_name])} lines but {vref_file} has {len(vrefs)}")
+    if problems:
+        return None
+
+    bsb_counts = word_counts(lines[bsb_text_file])
+    heb_grk_counts = word_counts(lines[heb_grk_text_file])
+    pairs, pair_lines, malformed = parse_pairs(lines[alignment_file])
+    report(problems, malformed, lambda line: f"{alignment_file} line {line + 1} is not in pharaoh format")
+    bad_bsb = (pairs[:, 0] < 1) | (pairs[:, 0] > bsb_counts[pair_lines])
+    bad_heb_grk = (pairs[:, 1] < 1) | (pairs[:, 1] > heb_grk_counts[pair_lines])
+    report(problems, np.unique(pair_lines[bad_bsb]),
+           lambda line: f"{alignment_file} line {line + 1} has a BSB word past the end of its line in {bsb_text_file}")
+    report(problems, np.unique(pair_lines[bad_heb_grk]),
+           lambda line: f"{alignment_file} line {line + 1} has a Hebrew or Greek word past the end of its line "
+                        f"in {heb_grk_text_file}")
+
+    references = [vref_pattern.match(vref) for vref in vrefs]
+    report(problems, [number for number, match in enumerate(references) if match is None],
+           lambda line: f"{vref_file} line {line + 1} is not a reference like GEN 1:1")
+    references = np.array([match.groups() if match else ("", 0, 0) for match in references]).reshape(-1, 3)
+    keys = verse_keys(references[:, 0], references[:, 1].astype(np.int64), references[:, 2].astype(np.int64))
+    return keys, heb_grk_counts
+
+def check_srclocs(usfm_folder, keys, heb_grk_counts, problems):
+    '''Every srcloc of the BSB USFM files has to point to a word of the Hebrew or Greek line of its verse'''
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    for path in sorted(glob.glob(os.path.join(usfm_folder, "bsb_*.usfm"))):
+        with open(path, encoding='utf-8') as usfm_file:
+            matches = srcloc_pattern.findall(usfm_file.read())
+        if not matches:
+            continue
+        srclocs = np.array(matches)
+        word_index = srclocs[:, 3].astype(np.int64)
+        srcloc_keys = verse_keys(srclocs[:, 0], srclocs[:, 1].astype(np.int64), srclocs[:, 2].astype(np.int64))
+        positions = np.minimum(np.searchsorted(sorted_keys, srcloc_keys), len(sorted_keys) - 1)
+        found = (sorted_keys[positions] == srcloc_keys) & (srcloc_keys >= 0)
+        lengths = np.where(found, heb_grk_counts[order[positions]], 0)
+        name = os.path.basename(path)
+        missing = np.flatnonzero(~found)
+        # One report per missing verse, at its first srcloc
+        missing = np.sort(missing[np.unique(srcloc_keys[missing], return_index=True)[1]])
+        report(problems, missing,
+               lambda index: f"{name}: srcloc of {'.'.join(srclocs[index, :3])} is of a verse missing from {vref_file}")
+        out_of_bounds = np.flatnonzero(found & ((word_index < 1) | (word_index > lengths)))
+        report(problems, out_of_bounds,
+               lambda index: f"{name}: srcloc word {word_index[index]} of {'.'.join(srclocs[index, :3])} is past "
+                             f"the {lengths[index]} words of its verse in {heb_grk_text_file}")
+
+def validate(output_folder="output", usfm_folder=None):
+    '''Problems found in the outputs in the folder, as messages. An empty list means they are consistent'''
+    problems = []
+    checked = check_alignment(output_folder, problems)
+    if checked is not None and len(checked[0]):
+        check_srclocs(usfm_folder or os.path.join(output_folder, "bsb_usfms"), *checked, problems)
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the generated alignment outputs are consistent")
+    parser.add_argument("--output", default="output")
+    parser.add_argument("--usfm-folder", help="Folder of the BSB USFM files, by default bsb_usfms in the output")
+    args = parser.parse_args(argv)
+    problems = validate(args.output, args.usfm_folder)
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise SystemExit(1)
+    print(f"The outputs in {args.output} are consistent")
+
+if __name__ == "__main__":
+    main()